@@ -0,0 +1,459 @@
+####################################################################################
+# Micro-benchmarks for the Student Absence Emailer (SAE) program.
+# Run with:  python benchmarkSAE.py                  (all the benchmarks)
+#            python benchmarkSAE.py pipeline --rows 10000 100000 1000000
+# The pipeline timings are appended to benchmarkSAEResults.json and compared with the
+# previous run of the same roster size, so a slower stage shows up as a regression.
+####################################################################################
+import argparse
+import asyncio
+import contextlib
+import csv
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from datetime import datetime
+
+import studentAbsenceEmailer as sae
+
+allPeriods = ["1", "2", "3", "4", "5", "6", "7", "8", "Adv"]
+
+
+startupTargetSeconds = 0.3  # time to the first prompt (warm roster cache) the startup benchmark checks against
+
+rosterPeriodCodes = ["A-01 01", "A-02 02", "A-03 03", "A-04 04", "B-05 05", "B-06 06", "B-07 07", "B-08 08", "A-ADV", "A-AFA", "X-99"]
+rosterPeriodTypes = ["CLASS"] * 50 + ["OFF PERIOD", "OFFICE AIDE"]
+
+
+# synthetic roster csv file in the studentAbsenceEmailerData column layout (ID, name, period type, period, teacher, email)
+# with a sprinkling of ignored periods/period types, unrecognized periods, missing emails and conflicting rows
+def writeSyntheticRoster(path, rowCount, teacherCount=300, seed=1, firstStudentID=1000000):
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as csvfile:
+        csvWriter = csv.writer(csvfile)
+        csvWriter.writerow(["Student ID", "Student Name", "Period Type", "Period", "Teacher", "Teacher Email"])
+        for i in range(rowCount):
+            studentNumber = i // 9 if rng.random() > 0.001 else rng.randrange(max(1, rowCount // 9))  # some students show up again later
+            period = rosterPeriodCodes[i % 9] if rng.random() > 0.01 else rng.choice(rosterPeriodCodes)
+            teacherNumber = rng.randrange(teacherCount)
+            studentName = f"Student{studentNumber}, Synthetic" if rng.random() > 0.0005 else f"Other{studentNumber}, Name"
+            email = f"teacher{teacherNumber}@austinisd.org" if rng.random() > 0.001 else ""
+            csvWriter.writerow([f" {firstStudentID + studentNumber}", studentName, rng.choice(rosterPeriodTypes), period, f"Teacher {teacherNumber}", email])
+
+
+# synthetic students dictionary in the same layout loadStudents() returns
+def makeStudents(studentCount, teacherCount=150, seed=1):
+    rng = random.Random(seed)
+    students = {}
+    for i in range(studentCount):
+        studentID = str(1000000 + i)
+        teachers = [None] * len(sae.periodSlots)
+        for period in allPeriods:
+            teachers[sae.periodSlotIndex[period]] = sys.intern(f"teacher{rng.randrange(teacherCount)}@austinisd.org")
+        students[studentID] = sae.Student(studentID, f"Student{i}, Synthetic", teachers)
+    return students
+
+
+# dates/classDatePeriods for a trip of dayCount days with all periods of the day missed
+def makeSlots(dayCount):
+    dates = []
+    classDatePeriods = []
+    for day in range(dayCount):
+        dates.append(f"04/{day + 1:02d}/25")
+        periods = sae.periodsAdvADay if day % 2 == 0 else sae.periodsAdvBDay
+        classDatePeriods.append([(period, None, None) for period in periods.split(",")])
+    return dates, classDatePeriods
+
+
+def bestOf(repeat, function, *args):
+    best = None
+    for _ in range(repeat):
+        startTime = time.perf_counter()
+        function(*args)
+        elapsed = time.perf_counter() - startTime
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+# time per (student x slot) should stay flat as students and slots grow (linear scaling)
+def benchmarkGrouping():
+    print("groupAbsencesByTeacher()")
+    print(f"  {'students':>8} {'slots':>6} {'seconds':>10} {'ns/student-slot':>16}")
+    students = makeStudents(5000)
+    studentIDs = list(students)
+    for studentCount in (300, 1000, 3000):
+        for dayCount in (1, 5, 20):
+            dates, classDatePeriods = makeSlots(dayCount)
+            slotCount = sum(len(classPeriods) for classPeriods in classDatePeriods)
+            seconds = bestOf(5, sae.groupAbsencesByTeacher, students, studentIDs[:studentCount], dates, classDatePeriods)
+            print(f"  {studentCount:>8} {slotCount:>6} {seconds:>10.4f} {seconds * 1e9 / (studentCount * slotCount):>16.1f}")
+
+
+# csv module loader vs pandas loader on a synthetic roster (both must give the same students and warnings)
+def benchmarkIngest(rowCount=500000):
+    print(f"roster ingestion ({rowCount} rows)")
+    with tempfile.TemporaryDirectory() as tempPath:
+        rosterPath = os.path.join(tempPath, "roster.csv")
+        writeSyntheticRoster(rosterPath, rowCount)
+        startTime = time.perf_counter()
+        csvResult = sae.readStudentsCsv(rosterPath)
+        csvSeconds = time.perf_counter() - startTime
+        print(f"  readStudentsCsv()       {csvSeconds:>8.2f} seconds  ({len(csvResult[0])} students, {len(csvResult[1])} warning lines)")
+        try:
+            startTime = time.perf_counter()
+            import pandas
+            print(f"  import pandas           {time.perf_counter() - startTime:>8.2f} seconds")
+        except ImportError:
+            print("  readStudentsCsvPandas() skipped (pandas is not installed)")
+            return
+        startTime = time.perf_counter()
+        pandasResult = sae.readStudentsCsvPandas(rosterPath)
+        pandasSeconds = time.perf_counter() - startTime
+        print(f"  readStudentsCsvPandas() {pandasSeconds:>8.2f} seconds  ({csvSeconds / pandasSeconds:.1f}x, same result: {pandasResult == csvResult})")
+
+
+# full roster load vs streaming only an event's students (time and peak memory, both must give the same students)
+def benchmarkStream(rowCount=1000000, idCount=30, seed=1):
+    print(f"streaming roster loader ({rowCount} rows, {idCount} student IDs)")
+    with tempfile.TemporaryDirectory() as tempPath:
+        rosterPath = os.path.join(tempPath, "roster.csv")
+        writeSyntheticRoster(rosterPath, rowCount)
+        results = {}
+        for name, studentIDs in (("full", None), ("stream", "event")):
+            if studentIDs == "event":
+                studentIDs = set(random.Random(seed).sample(sorted(results["full"]), idCount))
+            startTime = time.perf_counter()
+            students, warnings = sae.readStudentsCsv(rosterPath, studentIDs)
+            seconds = time.perf_counter() - startTime
+            tracemalloc.start()
+            sae.readStudentsCsv(rosterPath, studentIDs)
+            peakBytes = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results[name] = students
+            print(f"  {name:8} {seconds:>8.2f} seconds  {peakBytes / 2**20:>8.1f} MB peak  ({len(students)} students)")
+        print(f"  same students: {results['stream'] == {studentID: results['full'][studentID] for studentID in results['stream']}}")
+
+
+# query mode on a job history of eventCount events (index build once, then teacher, student, event and date queries)
+def benchmarkQuery(studentCount=20000, eventCount=200, seed=1):
+    rng = random.Random(seed)
+    students = makeStudents(studentCount)
+    studentIDs = sorted(students)
+    eventAbsences = []
+    for eventNumber in range(eventCount):
+        dates, classDatePeriods = makeSlots(rng.randint(1, 3))
+        emails, studentsNotFound = sae.groupAbsencesByTeacher(students, rng.sample(studentIDs, 30), dates, classDatePeriods)
+        eventKey = f"[SAE] Event {eventNumber}"
+        eventAbsences.extend((eventKey, eventKey, "2025-04-01T12:00:00") + absence for absence in sae.getAbsences(emails))
+    print(f"query mode ({studentCount} students, {eventCount} events, {len(eventAbsences)} stored student-periods)")
+    startTime = time.perf_counter()
+    queryIndex = sae.QueryIndex(students, eventAbsences)
+    print(f"  {'index build':30} {(time.perf_counter() - startTime) * 1000:>10.2f} ms")
+    for kind, value, dateSlot in (("teacher", "teacher1@austinisd.org", None), ("teacher", "teacher1@austinisd.org", sae.parseDateLine("04/01/25-04/02/25")),
+                                  ("student", eventAbsences[0][-1].rpartition("_")[2], None), ("event", "Event 1", None), ("dates", "04/01/25-04/03/25", None)):
+        seconds = bestOf(5, lambda: queryIndex.getReportRows(queryIndex.query(kind, value, dateSlot)))
+        rowCount = len(queryIndex.getReportRows(queryIndex.query(kind, value, dateSlot)))
+        print(f"  {kind + (' (dates)' if dateSlot else ''):30} {seconds * 1000:>10.2f} ms  ({rowCount} rows)")
+
+
+# one roster csv file per campus read one after the other vs by a process pool (both must give the same students and warnings)
+def benchmarkShards(campusCount=4, rowCount=250000):
+    print(f"multi-campus roster ({campusCount} csv files of {rowCount} rows, {os.cpu_count()} CPUs)")
+    with tempfile.TemporaryDirectory() as tempPath:
+        for campus in range(campusCount):
+            # the campuses overlap a little, so some students are in two csv files
+            writeSyntheticRoster(os.path.join(tempPath, f"campus{campus}.csv"), rowCount, seed=campus + 1, firstStudentID=1000000 + campus * (rowCount // 9 - 100))
+        cvsPaths = sae.getRosterPaths(tempPath)
+        startTime = time.perf_counter()
+        sequentialResult = sae.readRosterFiles(cvsPaths, workers=1)
+        sequentialSeconds = time.perf_counter() - startTime
+        print(f"  sequential       {sequentialSeconds:>8.2f} seconds  ({len(sequentialResult[0])} students, {len(sequentialResult[1])} warning lines)")
+        startTime = time.perf_counter()
+        parallelResult = sae.readRosterFiles(cvsPaths)
+        parallelSeconds = time.perf_counter() - startTime
+        print(f"  process pool     {parallelSeconds:>8.2f} seconds  ({sequentialSeconds / parallelSeconds:.1f}x, same result: {parallelResult == sequentialResult})")
+
+
+def makeDateLine(rng):
+    line = f"{rng.randint(1, 11)}/{rng.randint(1, 28):02d}/25"
+    if rng.random() < 0.2:
+        line += f"-12/{rng.randint(1, 28):02d}/25"
+    periodSlots = []
+    for period in rng.sample(allPeriods, rng.randint(0, 4)):
+        if rng.random() < 0.3:
+            period += f"{rng.choice(['leaving', 'returning'])}@{rng.randint(1, 12)}:{rng.randint(0, 59):02d}{rng.choice(['am', 'pm'])}"
+        periodSlots.append(period)
+    return line + (" " + ",".join(periodSlots) if periodSlots else "")
+
+
+def mutateLine(rng, line):
+    characters = list(line)
+    for _ in range(rng.randint(1, 3)):
+        position = rng.randrange(len(characters) + 1)
+        operation = rng.random()
+        if operation < 0.4 and position < len(characters):
+            del characters[position]
+        elif operation < 0.7 and position < len(characters):
+            characters[position] = rng.choice("0123456789/-,@ :apmlvAdgnr")
+        else:
+            characters.insert(position, rng.choice("0123456789/-,@ :apmlvAdgnr"))
+    return "".join(characters)
+
+
+# parse speed on a season's worth of pasted lines, and fuzzing: mutated lines must either parse or raise DateLineError
+def benchmarkDateLineParser(lineCount=10000, seed=1):
+    print(f"parseDateLine() ({lineCount} lines)")
+    rng = random.Random(seed)
+    lines = [makeDateLine(rng) for _ in range(lineCount)]
+    seconds = bestOf(5, lambda: [sae.parseDateLine(line) for line in lines])
+    print(f"  valid lines    {seconds:>8.4f} seconds  ({seconds * 1e6 / lineCount:.1f} microseconds/line)")
+    mutatedLines = [mutateLine(rng, line) for line in lines]
+    invalidCount = 0
+    startTime = time.perf_counter()
+    for line in mutatedLines:
+        try:
+            sae.parseDateLine(line)
+        except sae.DateLineError as e:
+            invalidCount += 1
+            assert 0 <= e.position <= len(line), line
+    seconds = time.perf_counter() - startTime
+    print(f"  mutated lines  {seconds:>8.4f} seconds  ({invalidCount} rejected with a DateLineError, no other exceptions)")
+
+
+# minimal local SMTP stand-in server (accepts and discards every message after 'delay' seconds of simulated latency)
+# counts the delivered messages, their recipients, the connections and the most connections open at the same time.
+# With closeAfterMessages the server drops a connection after that many messages (like a server closing idle connections).
+class LocalSmtpServer:
+    def __init__(self, delay=0.02, closeAfterMessages=None):
+        self.delay = delay
+        self.closeAfterMessages = closeAfterMessages
+        self.messageCount = 0
+        self.recipients = []
+        self.connectionCount = 0
+        self.openConnections = 0
+        self.maxOpenConnections = 0
+        self.loop = asyncio.new_event_loop()
+        self.ready = threading.Event()
+
+    async def handleClient(self, reader, writer):
+        self.connectionCount += 1
+        self.openConnections += 1
+        self.maxOpenConnections = max(self.maxOpenConnections, self.openConnections)
+        connectionMessageCount = 0
+        writer.write(b"220 localhost SMTP stand-in\r\n")
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                writer.write(b"250-localhost\r\n250 8BITMIME\r\n")
+            elif command == b"RCPT":
+                self.recipients.append(line.decode().partition("<")[2].partition(">")[0])
+                writer.write(b"250 OK\r\n")
+            elif command == b"DATA":
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                await writer.drain()
+                while (await reader.readline()) not in (b".\r\n", b""):
+                    pass
+                await asyncio.sleep(self.delay)  # simulated server latency
+                self.messageCount += 1
+                connectionMessageCount += 1
+                writer.write(b"250 OK\r\n")
+                if connectionMessageCount == self.closeAfterMessages:
+                    await writer.drain()
+                    break
+            elif command == b"QUIT":
+                writer.write(b"221 Bye\r\n")
+                await writer.drain()
+                break
+            else:
+                writer.write(b"250 OK\r\n")
+            await writer.drain()
+        self.openConnections -= 1
+        writer.close()
+
+    def run(self):
+        asyncio.set_event_loop(self.loop)
+        self.server = self.loop.run_until_complete(asyncio.start_server(self.handleClient, "127.0.0.1", 0))
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.ready.set()
+        self.loop.run_forever()
+
+    def __enter__(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        self.ready.wait()
+        return self
+
+    def __exit__(self, *exc):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+def makeMessages(messageCount):
+    return [(f"teacher{i}@austinisd.org", "[SAE] benchmark", "<p>absences</p>", "absences") for i in range(messageCount)]
+
+
+# messages/second of each transport, the smtp transport against the local stand-in server
+def benchmarkTransports(messageCount=200):
+    print(f"transports ({messageCount} messages)")
+    with tempfile.TemporaryDirectory() as tempPath:
+        transports = [sae.NullTransport(), sae.MaildirTransport(os.path.join(tempPath, "outbox"))]
+        with LocalSmtpServer() as server:
+            for concurrency in (1, 4, 16):
+                transports.append(sae.SmtpTransport("127.0.0.1", server.port, "sae@localhost", starttls=False, concurrency=concurrency))
+            for transport in transports:
+                startTime = time.perf_counter()
+                sendTimes = transport.sendAll(makeMessages(messageCount))
+                seconds = time.perf_counter() - startTime
+                transport.close()
+                print(f"  {transport.name:55} {len(sendTimes) / seconds:>10.1f} messages/second")
+
+
+# an event like a big field trip: eventShare of the roster's students out for dayCount days (all periods)
+def makeEvent(students, eventShare=0.1, dayCount=3, seed=1):
+    rng = random.Random(seed)
+    studentIDs = rng.sample(sorted(students), max(1, int(len(students) * eventShare)))
+    dates, classDatePeriods = makeSlots(dayCount)
+    return studentIDs, dates, classDatePeriods
+
+
+# seconds of every stage of one SAE run on a synthetic roster of rowCount rows
+def benchmarkPipelineStages(rowCount, tempPath):
+    stageSeconds = {}
+
+    def timeStage(stage, function, *args):
+        startTime = time.perf_counter()
+        result = function(*args)
+        stageSeconds[stage] = time.perf_counter() - startTime
+        return result
+
+    rosterPath = os.path.join(tempPath, f"roster{rowCount}.csv")
+    writeSyntheticRoster(rosterPath, rowCount)
+    with open(rosterPath, newline="", encoding="utf-8") as csvfile:
+        periodStrs = [row[3] for row in csv.reader(csvfile)][1:]
+    students, warnings = timeStage("csvLoad", sae.readStudentsCsv, rosterPath)
+    timeStage("periodDecoding", lambda: [sae.getPeriod(periodStr) for periodStr in periodStrs])
+    studentIDs, dates, classDatePeriods = makeEvent(students)
+    emails, studentsNotFound = timeStage("aggregation", sae.groupAbsencesByTeacher, students, studentIDs, dates, classDatePeriods)
+    emailsList = timeStage("emailsList", sae.buildEmailsList, emails)
+    sae.getTemplateEnvironment()  # the one time jinja2 setup is not part of the rendering stage
+    timeStage("rendering", lambda: [sae.renderTeacherEmail(emailList, "benchmark", "") for emailList in emailsList])
+    totals = {"emails": 0, "studentPeriods": 0}
+    renderEmail = lambda emailList: sae.renderTeacherEmail(emailList, "benchmark", "")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):  # no progress bar lines in the output
+        timeStage("renderAndNullSend", sae.NullTransport().sendAll, sae.renderedMessages(emailsList, "[SAE] benchmark", renderEmail, totals))
+    counts = {"students": len(students), "eventStudents": len(studentIDs), "emails": len(emailsList), "studentPeriods": totals["studentPeriods"]}
+    return stageSeconds, counts
+
+
+# the full pipeline (csv load -> period decoding -> aggregation -> emailsList -> rendering -> null transport) at each roster size,
+# every result is saved in resultsPath and compared with the previous result of the same size
+def benchmarkPipeline(rowCounts=(10000, 100000, 1000000), resultsPath="benchmarkSAEResults.json"):
+    try:
+        with open(resultsPath, encoding="utf-8") as resultsFile:
+            results = json.load(resultsFile)
+    except FileNotFoundError:
+        results = []
+    with tempfile.TemporaryDirectory() as tempPath:
+        for rowCount in rowCounts:
+            print(f"pipeline ({rowCount} rows)")
+            stageSeconds, counts = benchmarkPipelineStages(rowCount, tempPath)
+            previous = next((result for result in reversed(results) if result["rows"] == rowCount), None)
+            print(f"  {', '.join(f'{count} {name}' for name, count in counts.items())}")
+            print(f"  {'stage':20} {'seconds':>10} {'previous':>10} {'change':>8}")
+            for stage, seconds in stageSeconds.items():
+                line = f"  {stage:20} {seconds:>10.4f}"
+                if previous and stage in previous["stageSeconds"]:
+                    previousSeconds = previous["stageSeconds"][stage]
+                    change = (seconds - previousSeconds) / previousSeconds if previousSeconds else 0
+                    line += f" {previousSeconds:>10.4f} {change:>+8.0%}" + ("  REGRESSION?" if change > 0.2 else "")
+                print(line)
+            results.append({"date": datetime.now().isoformat(timespec="seconds"), "version": sae.version, "rows": rowCount,
+                            "counts": counts, "stageSeconds": stageSeconds})
+    with open(resultsPath, "w", encoding="utf-8") as resultsFile:
+        json.dump(results, resultsFile, indent=1)
+
+
+# modules imported by 'import studentAbsenceEmailer' (python -X importtime), returns [(cumulativeSeconds, module)] of
+# the modules studentAbsenceEmailer imports directly, and the total import seconds of studentAbsenceEmailer
+def getImportTimes():
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import studentAbsenceEmailer"],
+                            cwd=os.path.dirname(os.path.abspath(sae.__file__)), capture_output=True, text=True, check=True)
+    importTimes = []
+    totalSeconds = 0
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and not line.endswith("| imported package"):
+            selfTime, cumulativeTime, module = line[len("import time:"):].split("|")
+            if module.strip() == "studentAbsenceEmailer":
+                totalSeconds = int(cumulativeTime) / 1e6
+            elif module.startswith("   ") and not module.startswith("    "):  # imported by studentAbsenceEmailer itself
+                importTimes.append((int(cumulativeTime) / 1e6, module.strip()))
+    return sorted(importTimes, reverse=True), totalSeconds
+
+
+# seconds from starting the program until the subject prompt is shown
+def timeToFirstPrompt(workingPath):
+    environment = dict(os.environ, HOME=workingPath, USERPROFILE=workingPath, PYTHONUNBUFFERED="1")
+    startTime = time.perf_counter()
+    process = subprocess.Popen([sys.executable, os.path.abspath(sae.__file__)], cwd=workingPath, env=environment,
+                               stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+    output = b""
+    while b"Enter email subject" not in output:
+        chunk = process.stdout.read1(4096)
+        if not chunk:
+            raise RuntimeError(f"no subject prompt: {output.decode(errors='replace')}")
+        output += chunk
+    seconds = time.perf_counter() - startTime
+    process.kill()
+    process.wait()
+    return seconds
+
+
+# import time of the module (and its slowest imports) and the time to the first prompt against startupTargetSeconds
+def benchmarkStartup(repeat=5):
+    print("startup")
+    importTimes, totalSeconds = min((getImportTimes() for _ in range(repeat)), key=lambda result: result[1])
+    print(f"  import studentAbsenceEmailer {totalSeconds:>8.4f} seconds, slowest imports:")
+    for cumulativeSeconds, module in importTimes[:8]:
+        print(f"    {module:26} {cumulativeSeconds:>8.4f}")
+    with tempfile.TemporaryDirectory() as tempPath:
+        writeSyntheticRoster(os.path.join(tempPath, sae.csvStudentsFile), 20000)
+        coldSeconds = timeToFirstPrompt(tempPath)  # builds the roster cache
+        warmSeconds = min(timeToFirstPrompt(tempPath) for _ in range(repeat))
+    print(f"  first prompt (cold cache)    {coldSeconds:>8.4f} seconds")
+    print(f"  first prompt (warm cache)    {warmSeconds:>8.4f} seconds  " +
+          ("OK" if warmSeconds <= startupTargetSeconds else f"OVER the {startupTargetSeconds} second target"))
+
+
+benchmarks = {
+    "grouping": benchmarkGrouping,
+    "ingest": benchmarkIngest,
+    "stream": benchmarkStream,
+    "shards": benchmarkShards,
+    "dateline": benchmarkDateLineParser,
+    "query": benchmarkQuery,
+    "transports": benchmarkTransports,
+    "pipeline": benchmarkPipeline,
+    "startup": benchmarkStartup,
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="SAE benchmarks")
+    parser.add_argument("benchmarks", nargs="*", metavar="BENCHMARK", help=f"benchmarks to run: {', '.join(benchmarks)} (default: all)")
+    parser.add_argument("--rows", type=int, nargs="+", default=[10000, 100000, 1000000], help="pipeline roster sizes (default: 10000 100000 1000000)")
+    parser.add_argument("--results", default="benchmarkSAEResults.json", help="file the pipeline results are saved in")
+    args = parser.parse_args()
+    for name in args.benchmarks or benchmarks:
+        if name not in benchmarks:
+            parser.error(f"unknown benchmark {name} (choose from {', '.join(benchmarks)})")
+    for name in args.benchmarks or benchmarks:
+        if name == "pipeline":
+            benchmarkPipeline(args.rows, args.results)
+        else:
+            benchmarks[name]()
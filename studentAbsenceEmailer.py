@@ -1,40 +1,72 @@
 ####################################################################################
 # 4/14/2025  Version 1.1
 ####################################################################################
+# Only the modules needed before the first prompt are imported here. The slow or optional ones are imported
+# where they are first used: win32com (loadWin32com()), jinja2 (getTemplateEnvironment()), pandas, subprocess,
+# asyncio, concurrent.futures, smtplib, email, mailbox and sqlite3 (python benchmarkSAE.py startup measures the startup time).
 import csv
-import win32com.client  # pip install pywin32 (close and reopen Python after install) [for email using Outlook Windows app (https://github.com/mhammond/pywin32)] (Thonny install pywin32 package)
+import glob
 import re
-import random
 from datetime import datetime  # module is in python standard library
 from datetime import date  # module is in python standard library
-from jinja2 import Template  # pip install jinja2
-import pkgutil   # library that allows exe file to include and read the csv file data
-import io        # used with above import
+from datetime import timedelta  # module is in python standard library
 import sys
 import os
 from   pathlib  import Path      # module is in python standard library
-import subprocess
+import argparse
+import pickle
+import time
+import json
+import contextlib
+import threading
+import queue
+import itertools
+from collections import defaultdict, namedtuple
+
+win32com = None  # set by loadWin32com() when Outlook on Windows is used
+class com_error(Exception):  # stand-in so 'except com_error' works without pywin32 (never raised), replaced by loadWin32com()
+    pass
+
+# pip install pywin32 (close and reopen Python after install) [for email using Outlook Windows app (https://github.com/mhammond/pywin32)] (Thonny install pywin32 package)
+def loadWin32com():
+    global win32com, com_error
+    import win32com.client
+    from pywintypes import com_error  # raised when an Outlook (COM) call fails
 
 version = "1.1c"
 versionDate = "4/18/25"
 
 ## To generate an EXE file for Windows (in a cmd tool) using pyinstaller
 ## (1) cd C:\Users\E151509\My Drive\My LASA\misc\tools\studentAbsenceEmailer
-## (2) pyinstaller --onefile --add-data "studentAbsenceEmailerData2024-25.csv;." studentAbsenceEmailer.py
+## (2) pyinstaller --onefile --add-data "studentAbsenceEmailerData2024-25.csv;." --add-data "studentAbsenceEmailerPeriods.csv;." studentAbsenceEmailer.py
+##     (also add --add-data "studentAbsenceEmailerCalendar.csv;." when there is a school calendar file)
 ## (3) move studentAbsenceEmailer.exe from 'dist' folder to 'Latest EXE Release linked in documentation Google Doc' folder
+## Faster startup: a --onefile exe unpacks itself to a temp folder (sys._MEIPASS) on every launch. Building with --onedir
+##     instead of --onefile skips the unpacking (zip the dist\studentAbsenceEmailer folder and run studentAbsenceEmailer.exe in it,
+##     the --add-data files end up in its _internal folder which is sys._MEIPASS). Also add --exclude-module pandas unless
+##     --loader pandas is needed (pandas is only imported by --loader pandas and makes the exe a lot bigger).
 
 ## To generate a MAC OS X App Bundle using pyinstaller (might have to use 'pip3 install pyinstaller)
-## (1) comment out import win32.com.client line above
-## (2) pyinstaller --windowed --onefile --osx-bundle-identifier "<org.austinisd.studentAbsenceEmailer>" --add-data "studentAbsenceEmailerData2024-25.csv:." studentAbsenceEmailer.py
+## (1) (win32com is only imported on Windows, nothing to comment out anymore)
+## (2) pyinstaller --windowed --onefile --osx-bundle-identifier "<org.austinisd.studentAbsenceEmailer>" --add-data "studentAbsenceEmailerData2024-25.csv:." --add-data "studentAbsenceEmailerPeriods.csv:." studentAbsenceEmailer.py
+##     (also add --add-data "studentAbsenceEmailerCalendar.csv:." when there is a school calendar file)
 ## (3) move studentAbsenceEmailer.exe from 'dist' folder to 'Latest Apple Release linked in documentation Google Doc' folder
 
 csvStudentsFile = "studentAbsenceEmailerData2024-25.csv"
+periodCodesFile = "studentAbsenceEmailerPeriods.csv"  # optional 'Period Code Prefix,Period' table (Period 'ignore' = ignore students with this period)
+rosterCacheFile = "studentAbsenceEmailerData.cache"  # compiled copy of csvStudentsFile (rebuilt when the csv file changes)
+rosterCacheFormat = 2  # increase when the layout of the cached students changes (2 = Student records)
+jobStoreFile = "studentAbsenceEmailerJobs.sqlite"  # job history (what was sent for each event)
+metricsFile = "studentAbsenceEmailerMetrics.json"  # stage timings and counters of the last run (in ~/.studentAbsenceEmailer)
+profileFile = "studentAbsenceEmailerProfile.prof"  # cProfile dump of the last --profile run (python -m pstats to view it)
 
 defaultEmailFooter = """
 This email was sent by the Student Absence Emailer (SAE) program. Programs have bugs (especially ones written by a CS teacher).  Please let rainer.mueller@austinisd.org know if something looks awry. Documentation @ https://tinyurl.com/LASAStudentAbsenceEmailer
 """
 
 ignorePeriods = ["A-AFA","A-AFB","A-BFA","B-AFB","B-BFB"]  # ignore students with one of these periods
+# period code prefix -> period, used when there is no periodCodesFile (the first matching prefix wins)
+periodCodes = [("A-01","1"),("A-02","2"),("A-03","3"),("A-04","4"),("B-05","5"),("B-06","6"),("B-07","7"),("B-08","8"),("A-ADV","Adv")] + [(p,"ignore") for p in ignorePeriods]
 ignorePeriodTypes = ["OFF PERIOD","OFFICE AIDE"]  # ignore students with one of these period types
 
 ADays = ["Monday", "Wednesday"]
@@ -45,19 +77,19 @@ periodsBDay = "5,6,7,8"
 periodsAdvADay = "1,Adv,2,3,4"
 periodsAdvBDay = "5,Adv,6,7,8"
 
+# optional 'Date,Day Type' school calendar, dates in the calendar get the periods of their day type (no A-day/B-day question),
+# dates not in the calendar use ADays, BDays and XDays
+calendarFile = "studentAbsenceEmailerCalendar.csv"
+dayTypePeriods = {"A": periodsADay, "B": periodsBDay, "A+Adv": periodsAdvADay, "B+Adv": periodsAdvBDay, "Holiday": ""}
+schoolCalendar = {}  # date -> day type (loaded by loadSchoolCalendar())
+
+renderWorkers = 4     # threads rendering the emails while earlier emails are being sent
+renderQueueSize = 16  # maximum rendered emails waiting to be sent
+
 
 class bcolors:
     HEADER,BLUE,CYAN,GREEN,WARNING,RED,ENDC,BOLD,UNDERLINE,LIGHTGRAY,ORANGE,BLACK,BGGREEN,BGRED,BGYELLOW,BGCYAN = '\033[95m','\033[94m','\033[96m','\033[92m','\033[93m','\033[91m','\033[0m','\033[1m','\033[4m','\033[37m','\033[33m','\033[30m','\033[42m','\033[41m','\033[43m','\033[46m'
 
-def emailWithOutlookPC(email_recipient, email_subject, email_message):
-    outlook = win32com.client.Dispatch("Outlook.Application")
-    email = outlook.CreateItem(0)
-    email.To = email_recipient
-    email.Subject = email_subject
-    email.HTMLBody = email_message
-    email.send  # SEND THE EMAIL
-    return True
-
 # does NOT work with HTML (only with text emails)
 def emailWithOutlookApple(recipient, subject, body):
     apple_script = f'''
@@ -68,30 +100,63 @@ def emailWithOutlookApple(recipient, subject, body):
         send newMessage
     end tell
     '''
+    import subprocess
     subprocess.run(['osascript', '-e', apple_script])
 
+# reads the 'Period Code Prefix,Period' table (the header row and rows without a prefix or period are skipped)
+def readPeriodCodes(periodCodesPath):
+    with open(periodCodesPath, newline='', encoding='utf-8') as csvfile:
+        return [(row[0].strip(), row[1].strip()) for row in list(csv.reader(csvfile))[1:] if len(row) >= 2 and row[0].strip() and row[1].strip()]
+
+# all the period code prefixes are compiled into one anchored regex. 'ignore' prefixes are tried first, then the
+# other prefixes in table order, so a period code is decoded with a single match and dictionary lookup.
+# Every period (and '???' for unrecognized periods) also gets a slot, the index of its teacher in Student.teachers.
+# An empty table (or empty prefixes) would match every period code, so it raises a ValueError.
+def setPeriodCodes(newPeriodCodes):
+    global periodCodes, periodPattern, periodByPrefix, periodSlots, periodSlotIndex
+    if not newPeriodCodes or not all(prefix for prefix, period in newPeriodCodes):
+        raise ValueError("the period codes table needs at least one row and no empty prefixes")
+    periodCodes = newPeriodCodes
+    orderedPrefixes = [prefix for prefix, period in periodCodes if period == "ignore"] + [prefix for prefix, period in periodCodes if period != "ignore"]
+    periodPattern = re.compile("(" + "|".join(re.escape(prefix) for prefix in orderedPrefixes) + ")")
+    periodByPrefix = {}
+    for prefix, period in periodCodes:
+        periodByPrefix.setdefault(prefix, period)
+    periodSlots = list(dict.fromkeys(period for prefix, period in periodCodes if period != "ignore")) + ["???"]
+    periodSlotIndex = {period: slot for slot, period in enumerate(periodSlots)}
+
+# returns the period for a period code, 'ignore' for ignored period codes and '???' for unrecognized period codes
 def getPeriod(periodStr):
-    if periodStr.startswith("A-01"):
-        return "1"
-    elif periodStr.startswith("A-02"):
-        return "2"
-    elif periodStr.startswith("A-03"):
-        return "3"
-    elif periodStr.startswith("A-04"):
-        return "4"
-    elif periodStr.startswith("B-05"):
-        return "5"
-    elif periodStr.startswith("B-06"):
-        return "6"
-    elif periodStr.startswith("B-07"):
-        return "7"
-    elif periodStr.startswith("B-08"):
-        return "8"
-    elif periodStr.startswith("A-ADV"):
-        return "Adv"
+    match = periodPattern.match(periodStr)
+    if match:
+        return periodByPrefix[match.group(1)]
     else:
         return "???"
 
+setPeriodCodes(periodCodes)
+defaultPeriodCodes = periodCodes
+
+# one student of the roster, teachers[periodSlotIndex[period]] = teacherEmail (None = no class that period)
+class Student(namedtuple("Student", ["id", "name", "teachers"])):
+    __slots__ = ()
+
+    # yields the (period, teacherEmail) of every period the student has a class
+    def periods(self):
+        for period, teacherEmail in zip(periodSlots, self.teachers):
+            if teacherEmail is not None:
+                yield period, teacherEmail
+
+    # the student as it is listed in the emails
+    def tableRow(self):
+        return (self.name, self.id)
+
+# one warning per unrecognized period code (instead of one per row), unrecognized[periodCode] = [rowCount, firstRowCount, firstStudentID]
+def unrecognizedPeriodWarnings(unrecognized):
+    warnings = []
+    for periodCode, (rowCount, firstRowCount, firstStudentID) in unrecognized.items():
+        warnings.append(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} {rowCount} row{'s' if rowCount > 1 else ''} (first: row {firstRowCount} Student ID {firstStudentID}) {'have' if rowCount > 1 else 'has'} unrecognized period {periodCode}. Please add it to {periodCodesFile}.")
+    return warnings
+
 # suggested by chatgpt.com to solve a problem with the exe file reading in the csv file
 def get_data_file_path(filename):
     if getattr(sys, 'frozen', False):
@@ -103,6 +168,13 @@ def get_data_file_path(filename):
 
     return os.path.join(base_path, filename)
 
+# the PyInstaller --onefile temp folder (sys._MEIPASS) is deleted after every run, so files that
+# need to survive between runs (e.g. the roster cache) are kept in a folder in the user's home folder
+def getAppDataFilePath(filename):
+    appDataPath = os.path.join(os.path.expanduser("~"), ".studentAbsenceEmailer")
+    os.makedirs(appDataPath, exist_ok=True)
+    return os.path.join(appDataPath, filename)
+
 # chatgpt.com prompt "Python code that checks that a datetime object is between the prior August and the upcoming June "
 def is_between_prior_aug_and_upcoming_june(date_to_check: datetime) -> bool:
     today = datetime.today()
@@ -118,75 +190,1590 @@ def is_between_prior_aug_and_upcoming_june(date_to_check: datetime) -> bool:
 
 
 
-def main():
-    print(f'Version {version} ({versionDate}) for the 2024-25 school year.')
-    print(f'Documentation at https://tinyurl.com/LASAStudentAbsenceEmailer')
-    #print(f'Reading in {csvStudentsFile} file')
+def countRosterRows(rowCount, ignoredPeriodCount, ignoredPeriodTypeCount, unrecognizedPeriodCount):
+    metrics.count("rosterRowsRead", rowCount)
+    metrics.count("rosterRowsIgnoredPeriod", ignoredPeriodCount)
+    metrics.count("rosterRowsIgnoredPeriodType", ignoredPeriodTypeCount)
+    metrics.count("rosterRowsUnrecognizedPeriod", unrecognizedPeriodCount)
 
-    windows = False
-    apple = False
-    if sys.platform == "darwin":
-        #print("Running on macOS (Mac)")
-        apple = True
-    elif sys.platform == "win32":
-        #print("Running on Windows (PC)")
-        windows = True
-    else:
-        print(f'{bcolors.RED}Warning!!!{bcolors.ENDC} Can not determine if running on a Windows PC or a Mac.')               
-        
-    
-    #################################################################
-    ### read data from spreadsheet's csv file
-    #################################################################
+# yields the (rowCount, row) of only the rows of studentIDs (rowCount is the same csv row number readStudentsCsv() uses),
+# the other rows are parsed but no Student records are built for them
+def streamStudentRows(csvfile, studentIDs):
+    for rowCount, row in enumerate(csv.reader(csvfile), 1):
+        if row and row[0].strip() in studentIDs:
+            yield rowCount, row
+
+# returns (students, warnings) where students[studentID] = Student(studentID, studentName, teachers), the teacher emails are
+# interned so all the students of a teacher share one email string
+# with studentIDs (a set) only those students are read (streaming mode, memory only grows with the number of studentIDs)
+def readStudentsCsv(cvsPath, studentIDs=None):
     students = {}
-    rowCount = 0
-    
-    cvsPath = get_data_file_path(csvStudentsFile)
-    cvsFileDateTime = datetime.fromtimestamp(Path(cvsPath).stat().st_mtime)
-    if not is_between_prior_aug_and_upcoming_june(cvsFileDateTime):
-        print(f'{bcolors.RED}Warning!!!{bcolors.ENDC} {csvStudentsFile} from {cvsFileDateTime.strftime("%b %d, %Y")} is not for this school year.')               
+    warnings = []
+    unrecognized = {}
+    readCount = 0
+    ignoredPeriodCount = 0
+    ignoredPeriodTypeCount = 0
     with open(cvsPath, newline='', encoding='utf-8') as csvfile:
-        csvReader = csv.reader(csvfile)       
-        for row in csvReader:
-            rowCount += 1
+        rows = enumerate(csv.reader(csvfile), 1) if studentIDs is None else streamStudentRows(csvfile, studentIDs)
+        for rowCount, row in rows:
             if rowCount >= 2:
+                readCount += 1
+                if len(row) < 6:
+                    if any(field.strip() for field in row):
+                        warnings.append(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} row {rowCount} has only {len(row)} of the 6 columns (Student ID, Name, Period Type, Period, Teacher, Teacher Email). Skipping row.")
+                    continue
                 studentID = row[0].strip()
                 studentName = row[1].strip()
                 periodType = row[2].strip()
                 period = row[3].strip()
                 teacher = row[4].strip()
-                email = row[5].strip()
+                email = sys.intern(row[5].strip())
 
-                continue1 = False
-                for p in ignorePeriods:
-                    if period.startswith(p):
-                        continue1 = True
-                if continue1:
+                periodCode = period
+                period = getPeriod(periodCode)
+                if period == "ignore":
+                    ignoredPeriodCount += 1
                     continue
-                period = getPeriod(period)
                 if period == "???":
-                    print(row)
-                    print(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} row {rowCount} Student ID {studentID} has unrecognized period {period}. Please update getPeriod() function.")
+                    if periodCode in unrecognized:
+                        unrecognized[periodCode][0] += 1
+                    else:
+                        unrecognized[periodCode] = [1, rowCount, studentID]
                 continue2 = False
                 for pt in ignorePeriodTypes:
                     if periodType.startswith(pt):
                         continue2 = True
                 if continue2:
+                    ignoredPeriodTypeCount += 1
                     continue
                 if not email:
-                    print(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} row {rowCount} Student ID {studentID} for {teacher} does NOT have a teacher email. Skipping student.")
+                    warnings.append(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} row {rowCount} Student ID {studentID} for {teacher} does NOT have a teacher email. Skipping student.")
                     continue
-                if studentID in students:
-                    if studentName != students[studentID][0].split("_")[0]:
-                        print(f'  {bcolors.RED}Warning!!!{bcolors.ENDC} row {rowCount} Student ID {studentID} for name {studentName} already exists with name {students[studentID][0].split("_")[0]}.')
-                    emailDic = students[studentID][1]
-                    if period in emailDic:
-                        print(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} row {rowCount} Student ID {studentID} already has a previous period {period}.")
+                slot = periodSlotIndex[period]
+                student = students.get(studentID)
+                if student:
+                    if studentName != student.name:
+                        warnings.append(f'  {bcolors.RED}Warning!!!{bcolors.ENDC} row {rowCount} Student ID {studentID} for name {studentName} already exists with name {student.name}.')
+                    if student.teachers[slot] is not None:
+                        warnings.append(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} row {rowCount} Student ID {studentID} already has a previous period {period}.")
                     else:
-                        emailDic[period] = email
-                        students[studentID] = (studentName + "_" + studentID, emailDic)
+                        student.teachers[slot] = email
+                        if studentName != student.name:
+                            students[studentID] = student._replace(name=studentName)
                 else:
-                    students[studentID] = (studentName + "_" + studentID,{period: email})
+                    teachers = [None] * len(periodSlots)
+                    teachers[slot] = email
+                    students[studentID] = Student(studentID, studentName, teachers)
+    countRosterRows(readCount, ignoredPeriodCount, ignoredPeriodTypeCount, sum(count for count, firstRowCount, firstStudentID in unrecognized.values()))
+    return students, warnings + unrecognizedPeriodWarnings(unrecognized)
+
+# Same result as readStudentsCsv() but the filtering, period decoding and conflict detection are done
+# as vectorized (column at a time) operations. Needs pandas (pip install pandas), much faster for large csv files.
+def readStudentsCsvPandas(cvsPath):
+    import pandas as pd
+    columns = ["studentID", "studentName", "periodType", "period", "teacher", "email"]
+    df = pd.read_csv(cvsPath, header=None, skiprows=1, usecols=range(6), names=columns, dtype=str, keep_default_na=False, skip_blank_lines=False, encoding='utf-8')
+    df.index = df.index + 2  # index = row number in the csv file (row 1 is the header, blank lines are rows too)
+    df = df.apply(lambda column: column.str.strip())
+    warnings = []  # (row number, order within the row, warning)
+    readCount = len(df)
+
+    # pandas fills the missing columns of a short row with "" (like an empty column), so a row without an email might be
+    # a short row. Only then are the columns of every csv row counted, the short rows are skipped like in readStudentsCsv().
+    if (df.email == "").any():
+        with open(cvsPath, newline='', encoding='utf-8') as csvfile:
+            columnCounts = pd.Series([len(row) for row in csv.reader(csvfile)][1:], index=df.index)
+        isShort = columnCounts < 6
+        hasFields = (df != "").any(axis=1)
+        for rowCount, columnCount in zip(df.index[isShort & hasFields], columnCounts[isShort & hasFields]):
+            warnings.append((rowCount, 0, f"  {bcolors.RED}Warning!!!{bcolors.ENDC} row {rowCount} has only {columnCount} of the 6 columns (Student ID, Name, Period Type, Period, Teacher, Teacher Email). Skipping row."))
+        df = df[~isShort]
+
+    # str.extract() searches the whole code, so the pattern is anchored with ^ like periodPattern.match() in getPeriod()
+    decodedPeriod = df.period.str.extract("^" + periodPattern.pattern, expand=False).map(periodByPrefix).fillna("???")
+    isUnrecognized = decodedPeriod == "???"
+    unrecognizedRows = df[isUnrecognized].assign(rowCount=df.index[isUnrecognized])
+    unrecognizedCounts = unrecognizedRows.groupby("period", sort=False).agg(count=("rowCount", "size"), rowCount=("rowCount", "first"), studentID=("studentID", "first"))
+    unrecognized = {periodCode: [count, firstRowCount, firstStudentID] for periodCode, count, firstRowCount, firstStudentID in
+                    zip(unrecognizedCounts.index.tolist(), unrecognizedCounts["count"].tolist(), unrecognizedCounts.rowCount.tolist(), unrecognizedCounts.studentID.tolist())}
+    rowCount = len(df)
+    df = df.assign(period=decodedPeriod)[decodedPeriod != "ignore"]
+    ignoredPeriodCount = rowCount - len(df)
+    if ignorePeriodTypes:
+        df = df[~df.periodType.str.match("|".join(re.escape(pt) for pt in ignorePeriodTypes))]
+    countRosterRows(readCount, ignoredPeriodCount, rowCount - ignoredPeriodCount - len(df), int(isUnrecognized.sum()))
+    noEmail = df.email == ""
+    for rowCount, studentID, teacher in zip(df.index[noEmail], df.studentID[noEmail], df.teacher[noEmail]):
+        warnings.append((rowCount, 0, f"  {bcolors.RED}Warning!!!{bcolors.ENDC} row {rowCount} Student ID {studentID} for {teacher} does NOT have a teacher email. Skipping student."))
+    df = df[~noEmail]
+
+    # a row is accepted if the student does not already have its period, the name to compare to is the name of the student's last accepted row
+    accepted = ~df.duplicated(["studentID", "period"])
+    previousName = df.studentName.where(accepted).groupby(df.studentID).shift(1)
+    previousName = previousName.groupby(df.studentID).ffill()
+    nameConflict = previousName.notna() & (df.studentName != previousName)
+    for rowCount, studentID, studentName, existingName in zip(df.index[nameConflict], df.studentID[nameConflict], df.studentName[nameConflict], previousName[nameConflict]):
+        warnings.append((rowCount, 1, f'  {bcolors.RED}Warning!!!{bcolors.ENDC} row {rowCount} Student ID {studentID} for name {studentName} already exists with name {existingName}.'))
+    for rowCount, studentID, period in zip(df.index[~accepted], df.studentID[~accepted], df.period[~accepted]):
+        warnings.append((rowCount, 2, f"  {bcolors.RED}Warning!!!{bcolors.ENDC} row {rowCount} Student ID {studentID} already has a previous period {period}."))
+
+    df = df[accepted]
+    lastNames = df.groupby("studentID", sort=False).studentName.last()
+    students = {studentID: Student(studentID, studentName, [None] * len(periodSlots)) for studentID, studentName in zip(lastNames.index.tolist(), lastNames.tolist())}
+    for studentID, period, email in zip(df.studentID.tolist(), df.period.tolist(), df.email.tolist()):
+        students[studentID].teachers[periodSlotIndex[period]] = sys.intern(email)
+    return students, [warning for rowCount, order, warning in sorted(warnings)] + unrecognizedPeriodWarnings(unrecognized)
+
+# returns (emails, studentsNotFound) where emails[teacherEmail][dateStr][period] = [(leaveReturnStr, timeStr), (studentName, studentID), ...]
+def groupAbsencesByTeacher(students, studentIDs, dates, classDatePeriods):
+    # inverted index period -> [((studentName, studentID), teacherEmail)] built once for only the entered students
+    periodIndex = defaultdict(list)
+    studentsNotFound = {}
+    for studentID in studentIDs:
+        if studentID in students:
+            student = students[studentID]
+            tableRow = student.tableRow()
+            for period, teacherEmail in student.periods():
+                periodIndex[period].append((tableRow, teacherEmail))
+        else:
+            studentsNotFound[studentID] = True
+    # single pass over every (date, period) slot
+    emails = defaultdict(lambda: defaultdict(dict))
+    for dateStr, classPeriods in zip(dates, classDatePeriods):
+        for periodStr, leaveReturnStr, timeStr in classPeriods:
+            for tableRow, teacherEmail in periodIndex.get(periodStr, ()):
+                emails[teacherEmail][dateStr].setdefault(periodStr, [(leaveReturnStr, timeStr)]).append(tableRow)
+    return emails, studentsNotFound
+
+# the roster csv files of rosterPath, which is a csv file, a folder (all its .csv files except periodCodesFile and calendarFile,
+# e.g. one csv file per campus) or a glob pattern like 'exports/*Data*.csv'
+def getRosterPaths(rosterPath):
+    if os.path.isdir(rosterPath):
+        cvsPaths = [str(path) for path in Path(rosterPath).glob("*.csv") if path.name not in (periodCodesFile, calendarFile)]
+    elif glob.has_magic(rosterPath):
+        cvsPaths = [path for path in glob.glob(rosterPath) if os.path.basename(path) not in (periodCodesFile, calendarFile)]
+    else:
+        cvsPaths = [rosterPath]
+    if not cvsPaths:
+        raise FileNotFoundError(f"No roster csv files found for {rosterPath}")
+    return sorted(cvsPaths)
+
+# the cache is only valid for the exact same csv files (path, size, modification time), program version, cache format, period codes and ignore settings
+def getRosterCacheKey(cvsPaths):
+    cvsStats = [os.stat(cvsPath) for cvsPath in cvsPaths]
+    return (tuple((os.path.abspath(cvsPath), cvsStat.st_size, cvsStat.st_mtime_ns) for cvsPath, cvsStat in zip(cvsPaths, cvsStats)),
+            version, rosterCacheFormat, tuple(periodCodes), tuple(ignorePeriodTypes))
+
+# the period codes are read from periodCodesFile if it is next to the (first) csv file
+def loadPeriodCodes(cvsPath):
+    periodCodesPath = os.path.join(os.path.dirname(cvsPath), periodCodesFile)
+    if os.path.exists(periodCodesPath):
+        try:
+            setPeriodCodes(readPeriodCodes(periodCodesPath))
+        except ValueError:
+            print(f'{bcolors.RED}Warning!!!{bcolors.ENDC} {periodCodesFile} does not have any period codes. Using the default period codes.')
+            setPeriodCodes(defaultPeriodCodes)
+
+# Merges the (students, warnings) of every roster csv file (in cvsPaths order) the way readStudentsCsv() merges the rows of one file:
+# the first teacher of a period is kept and a student ID with another name or an already read period gets a warning.
+def mergeRosterShards(cvsPaths, shards):
+    students = {}
+    warnings = []
+    for cvsPath, (shardStudents, shardWarnings) in zip(cvsPaths, shards):
+        fileName = os.path.basename(cvsPath)
+        if shardWarnings:
+            warnings.append(f"  {fileName}:")
+            warnings.extend(shardWarnings)
+        for studentID, shardStudent in shardStudents.items():
+            student = students.get(studentID)
+            if student is None:
+                students[studentID] = shardStudent
+                continue
+            if shardStudent.name != student.name:
+                warnings.append(f'  {bcolors.RED}Warning!!!{bcolors.ENDC} {fileName} Student ID {studentID} for name {shardStudent.name} already exists with name {student.name}.')
+            accepted = False
+            for slot, email in enumerate(shardStudent.teachers):
+                if email is None:
+                    continue
+                if student.teachers[slot] is not None:
+                    warnings.append(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} {fileName} Student ID {studentID} already has a previous period {periodSlots[slot]}.")
+                else:
+                    student.teachers[slot] = email
+                    accepted = True
+            if accepted and shardStudent.name != student.name:
+                students[studentID] = student._replace(name=shardStudent.name)
+    return students, warnings
+
+# Reads one roster csv file in a worker process. The worker processes do not have the parent's period codes and ignore
+# settings on Windows (they are started fresh), so they are passed along, and the roster counters are returned to the parent.
+def readRosterFile(cvsPath, loader, studentIDs, newPeriodCodes, newIgnorePeriodTypes):
+    global ignorePeriodTypes
+    setPeriodCodes(newPeriodCodes)
+    ignorePeriodTypes = newIgnorePeriodTypes
+    metrics.counters.clear()
+    if loader == "pandas":
+        students, warnings = readStudentsCsvPandas(cvsPath)
+    else:
+        students, warnings = readStudentsCsv(cvsPath, studentIDs)
+    return students, warnings, dict(metrics.counters)
+
+# returns (students, warnings) of all the roster csv files. Several files are read in parallel by up to workers
+# processes (default: one per CPU, 1 = read them one after the other) and merged with mergeRosterShards().
+def readRosterFiles(cvsPaths, loader="csv", studentIDs=None, workers=None):
+    workers = min(workers or os.cpu_count() or 1, len(cvsPaths))
+    if workers == 1:
+        shards = [readStudentsCsvPandas(cvsPath) if loader == "pandas" else readStudentsCsv(cvsPath, studentIDs) for cvsPath in cvsPaths]
+    else:
+        import concurrent.futures
+        shards = []
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(readRosterFile, cvsPath, loader, studentIDs, periodCodes, ignorePeriodTypes) for cvsPath in cvsPaths]
+            for future in futures:
+                students, warnings, counters = future.result()
+                for name, value in counters.items():
+                    metrics.count(name, value)
+                shards.append((students, warnings))
+    if len(shards) == 1:
+        return shards[0]
+    return mergeRosterShards(cvsPaths, shards)
+
+# load the students from the compiled roster cache (warm) or from the csv file(s) (cold, which rebuilds the cache)
+# loader "pandas" reads the csv files with readStudentsCsvPandas(). rosterPath can also be a folder or glob (see getRosterPaths()).
+def loadStudents(rosterPath, rebuildCache=False, loader="csv", workers=None):
+    startTime = time.perf_counter()
+    cvsPaths = getRosterPaths(rosterPath)
+    loadPeriodCodes(cvsPaths[0])
+    cachePath = getAppDataFilePath(rosterCacheFile)
+    cacheKey = getRosterCacheKey(cvsPaths)
+    cache = None
+    if not rebuildCache and os.path.exists(cachePath):
+        try:
+            with open(cachePath, "rb") as cacheFile:
+                cache = pickle.load(cacheFile)
+        except Exception:
+            cache = None  # unreadable/old cache file, just rebuild it
+        if not isinstance(cache, dict) or cache.get("key") != cacheKey:
+            cache = None
+    if cache:
+        loadType = "warm (roster cache)"
+        metrics.count("rosterCacheHits")
+    else:
+        loadType = "cold (csv file)" if len(cvsPaths) == 1 else f"cold ({len(cvsPaths)} csv files)"
+        if loader == "pandas":
+            try:
+                students, warnings = readRosterFiles(cvsPaths, loader, workers=workers)
+            except ImportError:
+                print(f'{bcolors.RED}Warning!!!{bcolors.ENDC} --loader pandas needs pandas (pip install pandas). Using the csv loader.')
+                students, warnings = readRosterFiles(cvsPaths, workers=workers)
+        else:
+            students, warnings = readRosterFiles(cvsPaths, workers=workers)
+        cache = {"key": cacheKey, "students": students, "warnings": warnings}
+        try:
+            with open(cachePath, "wb") as cacheFile:
+                pickle.dump(cache, cacheFile, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f'{bcolors.RED}Warning!!!{bcolors.ENDC} Could not write roster cache {cachePath} ({e}).')
+    for warning in cache["warnings"]:
+        print(warning)
+    print(f'Loaded {len(cache["students"])} students {loadType} in {time.perf_counter() - startTime:.3f} seconds.')
+    return cache["students"]
+
+# loader "stream": only the students of the entered studentIDs are read from the csv file(s) (no roster cache),
+# for very large (whole district) csv files
+def loadStudentsForIDs(rosterPath, studentIDs, workers=None):
+    startTime = time.perf_counter()
+    cvsPaths = getRosterPaths(rosterPath)
+    loadPeriodCodes(cvsPaths[0])
+    students, warnings = readRosterFiles(cvsPaths, "stream", set(studentIDs), workers)
+    for warning in warnings:
+        print(warning)
+    print(f'Loaded {len(students)} students (streamed from csv file) in {time.perf_counter() - startTime:.3f} seconds.')
+    return students
+
+#################################################################
+### Date line parser ('mm/dd/yy[-mm/dd/yy] [#[leaving|returning@h:mm(am|pm)],...]')
+#################################################################
+PeriodSlot = namedtuple("PeriodSlot", ["period", "leaveReturn", "time"])  # leaveReturn and time are None for the whole period
+DateSlot = namedtuple("DateSlot", ["firstDate", "lastDate", "periodSlots"])  # no periodSlots = all the periods of the day
+
+dateLineDatePattern = re.compile(r"(0?[1-9]|1[0-2])/(0?[1-9]|[12][0-9]|3[01])/(\d{2})")
+dateLinePeriodPattern = re.compile(r"([1-8]|[Aa]dv)(leaving|returning)?")
+dateLineTimePattern = re.compile(r"(0?[1-9]|1[0-2]):[0-5][0-9](am|pm|AM|PM)")
+
+class DateLineError(ValueError):
+    def __init__(self, line, position, message):
+        super().__init__(f"{message} at position {position + 1}")
+        self.line = line
+        self.position = position
+        self.message = message
+
+    # the line with a ^ under the error position
+    def showPosition(self, indent="  "):
+        return f"{indent}{self.line}\n{indent}{' ' * self.position}^ {self.message}"
+
+def parseDateLineDate(line, position):
+    match = dateLineDatePattern.match(line, position)
+    if not match:
+        raise DateLineError(line, position, "expected a mm/dd/yy date")
+    try:
+        return date(2000 + int(match.group(3)), int(match.group(1)), int(match.group(2))), match.end()
+    except ValueError:
+        raise DateLineError(line, position, "not a valid date") from None
+
+# parses one date line in a single left to right pass, raises DateLineError (with the position of the error) for invalid lines
+def parseDateLine(line):
+    firstDate, position = parseDateLineDate(line, 0)
+    lastDate = firstDate
+    if line.startswith("-", position):
+        lastDate, endPosition = parseDateLineDate(line, position + 1)
+        if lastDate < firstDate:
+            raise DateLineError(line, position + 1, "the last date is before the first date")
+        position = endPosition
+    periodSlots = []
+    if position < len(line):
+        if line[position] != " ":
+            raise DateLineError(line, position, "expected a space before the periods")
+        position += 1
+        while True:
+            match = dateLinePeriodPattern.match(line, position)
+            if not match:
+                raise DateLineError(line, position, "expected a period (1-8 or Adv)")
+            period = "Adv" if match.group(1).lower() == "adv" else match.group(1)
+            leaveReturn = match.group(2)
+            timeStr = None
+            position = match.end()
+            if leaveReturn:
+                if not line.startswith("@", position):
+                    raise DateLineError(line, position, f"expected @ after {leaveReturn}")
+                timeMatch = dateLineTimePattern.match(line, position + 1)
+                if not timeMatch:
+                    raise DateLineError(line, position + 1, "expected a h:mm time ending in am or pm")
+                timeStr = timeMatch.group(0)
+                position = timeMatch.end()
+            periodSlots.append(PeriodSlot(period, leaveReturn, timeStr))
+            if position == len(line):
+                break
+            if line[position] != ",":
+                raise DateLineError(line, position, "expected a ',' between periods")
+            position += 1
+    return DateSlot(firstDate, lastDate, periodSlots)
+
+# ask the user if a date (in XDays) is an A-day or a B-day, returns 'a' or 'b'
+def askDayType(dayOfTheWeek, dateStr):
+    while True:
+        response = input(f"  Is {dayOfTheWeek} {dateStr} an A-day or a B-day (answer 'a' or 'b')? ").strip().lower()
+        if response == "a" or response == "b":
+            return response
+        else:
+            print("  Please respond with either 'a' or 'b'.")
+
+# reads the 'Date,Day Type' school calendar into {date: day type}. Date can also be a mm/dd/yy-mm/dd/yy range.
+def readSchoolCalendar(calendarPath):
+    calendar = {}
+    with open(calendarPath, newline='', encoding='utf-8') as csvfile:
+        for row in list(csv.reader(csvfile))[1:]:
+            if not row or not row[0].strip():
+                continue
+            if len(row) < 2:
+                print(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} {calendarFile} has no day type for {row[0].strip()} (use {', '.join(dayTypePeriods)}).")
+                continue
+            dayType = row[1].strip()
+            if dayType not in dayTypePeriods:
+                print(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} {calendarFile} has unknown day type {dayType} for {row[0].strip()} (use {', '.join(dayTypePeriods)}).")
+                continue
+            try:
+                dateSlot = parseDateLine(row[0].strip())
+            except DateLineError as e:
+                print(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} {calendarFile} has an invalid date ({e}).")
+                continue
+            for dateObject in getDateRange(dateSlot.firstDate, dateSlot.lastDate):
+                calendar[dateObject] = dayType
+    return calendar
+
+def loadSchoolCalendar():
+    global schoolCalendar
+    calendarPath = get_data_file_path(calendarFile)
+    if os.path.exists(calendarPath):
+        schoolCalendar = readSchoolCalendar(calendarPath)
+
+# all the dates from firstDate to lastDate
+def getDateRange(firstDate, lastDate):
+    return [firstDate + timedelta(days=i) for i in range((lastDate - firstDate).days + 1)]
+
+# the periods of a date ('' if there is no school), from the school calendar or (for dates not in the calendar)
+# from the day of the week. getDayType(dayOfTheWeek, dateStr) returns 'a' or 'b' for dates in XDays.
+def getDayPeriods(dateObject, getDayType):
+    if dateObject in schoolCalendar:
+        return dayTypePeriods[schoolCalendar[dateObject]]
+    dayOfTheWeek = dateObject.strftime("%A")
+    if dayOfTheWeek in XDays:
+        if getDayType(dayOfTheWeek, dateObject.strftime("%m/%d/%y")) == "a":
+            return periodsAdvADay
+        else:
+            return periodsAdvBDay
+    elif dayOfTheWeek in ADays:
+        return periodsADay
+    elif dayOfTheWeek in BDays:
+        return periodsBDay
+    else:
+        return ""
+
+# turns the parsed date lines (DateSlots) into (dates, classDatePeriods, periodsMissedCount)
+# where classDatePeriods[i] = [PeriodSlot(period, leaveReturn, time), ...] for dates[i].
+def expandDatePeriods(dateSlots, todaysDate, getDayType=askDayType):
+    dates = []
+    classDatePeriods = []
+    periodsMissedCount = 0
+    for dateSlot in dateSlots:
+        isDateRange = dateSlot.lastDate != dateSlot.firstDate
+        for dateObject in getDateRange(dateSlot.firstDate, dateSlot.lastDate):
+            dateStr = dateObject.strftime("%m/%d/%y")
+            dayOfTheWeek = dateObject.strftime("%A")
+            daysFromNow = (dateObject - todaysDate).days
+            dayPeriods = getDayPeriods(dateObject, getDayType).split(",")
+            if dayPeriods == [""]:
+                if not isDateRange:  # weekends and holidays in a date range are skipped silently
+                    print(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} There is no school on {dayOfTheWeek} {dateStr}. Disregarding it.")
+                continue
+            datePeriods = dateSlot.periodSlots
+            if isDateRange and datePeriods:
+                # the periods entered for a date range only apply to the days these classes meet
+                notMeeting = [periodSlot.period for periodSlot in datePeriods if periodSlot.period not in dayPeriods]
+                if notMeeting:
+                    datePeriods = [periodSlot for periodSlot in datePeriods if periodSlot.period in dayPeriods]
+                    print(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} There is no period {','.join(notMeeting)} on {dayOfTheWeek} {dateStr}. Disregarding {'them' if len(notMeeting) > 1 else 'it'} on this day.")
+                    if not datePeriods:
+                        continue
+            if not datePeriods:
+                datePeriods = [PeriodSlot(period, None, None) for period in dayPeriods]
+            elif len(datePeriods) == 1 and datePeriods[0].period in dayPeriods:
+                periodIndex = dayPeriods.index(datePeriods[0].period)
+                if datePeriods[0].leaveReturn == "returning":
+                    # only 1 period entered, the student misses the start of the day up to (and including) this period
+                    datePeriods = [PeriodSlot(period, None, None) for period in dayPeriods[:periodIndex]] + datePeriods
+                else:
+                    # only 1 period entered, the student misses the rest of the day starting with this period
+                    datePeriods = datePeriods + [PeriodSlot(period, None, None) for period in dayPeriods[periodIndex + 1:]]
+            periodsMissedCount += len(datePeriods)
+            printPeriodsStr = ""
+            for periodSlot in datePeriods:
+                if periodSlot.leaveReturn:
+                    printPeriodsStr += f"{periodSlot.period}({periodSlot.leaveReturn} at {periodSlot.time}) "
+                else:
+                    printPeriodsStr += f"{periodSlot.period} "
+            print(
+                f'  in {daysFromNow} day{"s" if daysFromNow > 1 else ""}, on {dayOfTheWeek} {dateStr}, periods: {printPeriodsStr}'
+            )
+            dates.append(dateStr)
+            classDatePeriods.append(datePeriods)
+    return dates, classDatePeriods, periodsMissedCount
+
+def getDateList(teacherDates):
+    dateList = []
+    for dateStr in teacherDates:
+        periodList = []
+        for period in teacherDates[dateStr]:
+            periodList.append((period, teacherDates[dateStr][period]))
+        periodList.sort()
+        dateList.append([dateStr, periodList])
+    dateList.sort()
+    return dateList
+
+# transfer the emails dictionary into the sorted list emailsList = [[teacherEmail, dateList, removedDateList], ...]
+# where dateList = [[dateStr, [(period, [timeTuple, (studentName, studentID), ...]), ...]], ...] and removedDateList (same layout)
+# holds the absences from removedEmails (students that will no longer miss the teacher's classes)
+def buildEmailsList(emails, removedEmails=None):
+    if removedEmails is None:
+        removedEmails = {}
+    emailsList = []
+    for email in sorted(set(emails) | set(removedEmails)):
+        emailsList.append([email, getDateList(emails.get(email, {})), getDateList(removedEmails.get(email, {}))])
+    return emailsList
+
+#################################################################
+### Email templates
+#################################################################
+# Copy any of these templates (e.g. email.html and/or email.txt) into the 'templates' folder in the SAE data folder (~/.studentAbsenceEmailer) to change how the emails look.
+# absenceDates is emailList[1] = [[dateStr, [(period, [(leaveReturnStr, timeStr), (studentName, studentID), ...]), ...]], ...]
+# and removedDates (delta emails) is emailList[2] with the same layout. digest.* get a list of events with these values.
+# The absence tables are macros in macros.*, so a changed macros.html also changes the digest emails.
+# report.html is the --query --report html file (columns = reportColumns, rows = one list of strings per student-period).
+emailTemplates = {
+    "macros.html": """
+{% macro absenceTable(dates) %}
+{% for dateStr, periodsList in dates %}
+<h3 style="display:inline;">{{ dateStr|dayOfTheWeek }} {{ dateStr }}</h3>
+{% for period, periodEntry in periodsList %}
+{% set leaveReturnStr, timeStr = periodEntry[0] %}
+<ul><h4>Period {{ period }}{% if leaveReturnStr %} ({{ leaveReturnStr }} at {{ timeStr }}){% endif %}</h4><table>
+{% for student in periodEntry[1:]|sort(case_sensitive=true) %}
+{% set studentName, studentID = student %}
+<tr><td style="padding-right: 15px;">{{ studentName }}</td> <td>{{ studentID }}</td></tr>
+{% endfor %}
+</table></ul>
+{% endfor %}
+{% endfor %}
+{% endmacro %}
+{% macro eventAbsences(onBehalfOfName, emailMessage, absenceDates, removedDates) %}
+{% if onBehalfOfName %}
+<p>This email was sent by SAE on behalf of {{ onBehalfOfName }}.</p>
+{% endif %}
+<p>{{ emailMessage }}</p>
+{% if absenceDates %}
+<p>The students listed below will miss <b>your</b> classes.</p>
+{{ absenceTable(absenceDates) }}
+{% endif %}
+{% if removedDates %}
+<p>The students listed below will <b>no longer</b> miss your classes.</p>
+{{ absenceTable(removedDates) }}
+{% endif %}
+{% endmacro %}
+""",
+    "macros.txt": """
+{% macro absenceTable(dates) %}
+{% for dateStr, periodsList in dates %}
+
+{{ dateStr|dayOfTheWeek }} {{ dateStr }}
+{% for period, periodEntry in periodsList %}
+{% set leaveReturnStr, timeStr = periodEntry[0] %}
+
+Period {{ period }}{% if leaveReturnStr %} ({{ leaveReturnStr }} at {{ timeStr }}){% endif %}
+
+{% for student in periodEntry[1:]|sort(case_sensitive=true) %}
+{% set studentName, studentID = student %}
+	{{ "%-27s"|format(studentName[0:27]) }} {{ studentID }}
+{% endfor %}
+{% endfor %}
+{% endfor %}
+{% endmacro %}
+{% macro eventAbsences(onBehalfOfName, emailMessage, absenceDates, removedDates) %}
+{% if onBehalfOfName %}
+This email was sent by SAE on behalf of {{ onBehalfOfName }}.
+{% endif %}
+
+{{ emailMessage }}
+{% if absenceDates %}
+
+The students listed below will miss YOUR classes.
+
+{{ absenceTable(absenceDates) }}
+{% endif %}
+{% if removedDates %}
+
+The students listed below will NO LONGER miss your classes.
+
+{{ absenceTable(removedDates) }}
+{% endif %}
+{% endmacro %}
+""",
+    "email.html": """
+{% from "macros.html" import eventAbsences %}
+<html>
+<head>
+    <title>{{ title }}</title>
+</head>
+<body>
+{{ eventAbsences(onBehalfOfName, emailMessage, absenceDates, removedDates) -}}
+<p>{{ defaultEmailFooter }}</p>
+</body>
+</html>
+""",
+    "email.txt": """
+{% from "macros.txt" import eventAbsences %}
+{{ eventAbsences(onBehalfOfName, emailMessage, absenceDates, removedDates) }}
+{{ defaultEmailFooter }}
+""",
+    "digest.html": """
+{% from "macros.html" import eventAbsences %}
+<html>
+<head>
+    <title>{{ title }}</title>
+</head>
+<body>
+<p>This email combines the student absences of {{ events|length }} event{{ "s" if events|length != 1 }}.</p>
+{% for event in events %}
+<h2>{{ event.subject }}</h2>
+{{ eventAbsences(event.onBehalfOfName, event.emailMessage, event.absenceDates, event.removedDates) }}
+{% endfor %}
+<p>{{ defaultEmailFooter }}</p>
+</body>
+</html>
+""",
+    "digest.txt": """
+{% from "macros.txt" import eventAbsences %}
+This email combines the student absences of {{ events|length }} event{{ "s" if events|length != 1 }}.
+{% for event in events %}
+
+==== {{ event.subject }} ====
+{{ eventAbsences(event.onBehalfOfName, event.emailMessage, event.absenceDates, event.removedDates) }}
+{% endfor %}
+
+{{ defaultEmailFooter }}
+""",
+    "report.html": """
+<html>
+<head>
+    <title>{{ title }}</title>
+</head>
+<body>
+<h2>{{ title }}</h2>
+<table>
+<tr>{% for column in columns %}<th style="text-align: left; padding-right: 15px;">{{ column }}</th>{% endfor %}</tr>
+{% for row in rows %}
+<tr>{% for cell in row %}<td style="padding-right: 15px;">{{ cell }}</td>{% endfor %}</tr>
+{% endfor %}
+</table>
+<p>{{ rows|length }} student-periods.</p>
+</body>
+</html>
+""",
+}
+
+templateEnvironment = None
+
+def getDayOfTheWeek(dateStr):
+    return datetime.strptime(dateStr, "%m/%d/%y").strftime("%A")
+
+# the jinja2 environment is created once per run, the compiled templates are cached on disk between runs
+def getTemplateEnvironment():
+    global templateEnvironment
+    if templateEnvironment is None:
+        from jinja2 import Environment, ChoiceLoader, DictLoader, FileSystemLoader, FileSystemBytecodeCache, select_autoescape  # pip install jinja2
+        userTemplatesPath = getAppDataFilePath("templates")
+        bytecodeCachePath = getAppDataFilePath("templateCache")
+        os.makedirs(bytecodeCachePath, exist_ok=True)
+        templateEnvironment = Environment(
+            loader=ChoiceLoader([FileSystemLoader(userTemplatesPath), DictLoader(emailTemplates)]),
+            bytecode_cache=FileSystemBytecodeCache(bytecodeCachePath),
+            autoescape=select_autoescape(["html"]),
+            trim_blocks=True,
+            lstrip_blocks=True,
+        )
+        templateEnvironment.filters["dayOfTheWeek"] = getDayOfTheWeek
+    return templateEnvironment
+
+# returns (periodStudentStr, studentAbscenceCount) for one teacher's emailList
+def countTeacherAbsences(emailList):
+    studentAbscenceCount = 0
+    periodStudentStr = ""
+    for dateStr, periodsList in emailList[1]:
+        for period, periodEntry in periodsList:
+            periodStudentStr += f"Period {period}({len(periodEntry) - 1}) "
+            studentAbscenceCount += len(periodEntry) - 1
+    for dateStr, periodsList in (emailList[2] if len(emailList) > 2 else []):
+        for period, periodEntry in periodsList:
+            periodStudentStr += f"Period {period}(-{len(periodEntry) - 1}) "
+    return periodStudentStr, studentAbscenceCount
+
+# returns (emailBodyHTML, emailBodyText, periodStudentStr, studentAbscenceCount) for one teacher's emailList
+def renderTeacherEmail(emailList, emailMessage, onBehalfOfName):
+    periodStudentStr, studentAbscenceCount = countTeacherAbsences(emailList)
+    templateValues = {
+        "title": "SAE email",
+        "onBehalfOfName": onBehalfOfName,
+        "emailMessage": emailMessage,
+        "absenceDates": emailList[1],
+        "removedDates": emailList[2] if len(emailList) > 2 else [],
+        "defaultEmailFooter": defaultEmailFooter,
+    }
+    emailBodyHTML = getTemplateEnvironment().get_template("email.html").render(templateValues)
+    emailBodyText = getTemplateEnvironment().get_template("email.txt").render(templateValues)
+    return emailBodyHTML, emailBodyText, periodStudentStr, studentAbscenceCount
+
+# same as renderTeacherEmail() for one teacher's digestEmailList = [teacherEmail, [(preparedEvent, emailList), ...]]
+def renderDigestEmail(digestEmailList):
+    periodStudentStr = ""
+    studentAbscenceCount = 0
+    events = []
+    for preparedEvent, emailList in digestEmailList[1]:
+        eventPeriodStudentStr, eventAbscenceCount = countTeacherAbsences(emailList)
+        periodStudentStr += f"[{preparedEvent['subject']}] {eventPeriodStudentStr}"
+        studentAbscenceCount += eventAbscenceCount
+        events.append({
+            "subject": preparedEvent["subject"],
+            "onBehalfOfName": preparedEvent["onBehalfOfName"],
+            "emailMessage": preparedEvent["emailMessage"],
+            "absenceDates": emailList[1],
+            "removedDates": emailList[2],
+        })
+    templateValues = {"title": "SAE email", "events": events, "defaultEmailFooter": defaultEmailFooter}
+    emailBodyHTML = getTemplateEnvironment().get_template("digest.html").render(templateValues)
+    emailBodyText = getTemplateEnvironment().get_template("digest.txt").render(templateValues)
+    return emailBodyHTML, emailBodyText, periodStudentStr, studentAbscenceCount
+
+def progressBar(count, total, width=20):
+    filled = width * count // total if total else width
+    return f"[{'#' * filled}{'.' * (width - filled)}] {count:>{len(str(total))}}/{total}"
+
+# Yields the (recipient, subject, emailBodyHTML, emailBodyText) messages in emailsList order while renderWorkers threads
+# render the next emails ahead of the transport (at most renderQueueSize rendered emails waiting to be sent), so rendering
+# overlaps with sending. renderEmail(emailList) returns (emailBodyHTML, emailBodyText, periodStudentStr, studentAbscenceCount)
+# and totals["emails"] and totals["studentPeriods"] are counted up as the messages are handed out.
+def renderedMessages(emailsList, emailSubject, renderEmail, totals):
+    import concurrent.futures
+    getTemplateEnvironment()  # create it before the render threads use it
+    renderedQueue = queue.Queue(maxsize=renderQueueSize)
+    stopRendering = threading.Event()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=renderWorkers)
+
+    # blocks while the queue is full (backpressure), returns False if the transport stopped asking for messages
+    def putUnlessStopped(item):
+        while not stopRendering.is_set():
+            try:
+                renderedQueue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def timedRenderEmail(emailList):
+        with metrics.stage("render"):
+            return renderEmail(emailList)
+
+    def produce():
+        for emailList in emailsList:
+            future = executor.submit(timedRenderEmail, emailList)
+            if not putUnlessStopped((emailList[0], future)):
+                return
+        putUnlessStopped(None)
+
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            item = renderedQueue.get()
+            if item is None:
+                break
+            recipient, future = item
+            emailBodyHTML, emailBodyText, periodStudentStr, absenceCount = future.result()
+            totals["emails"] += 1
+            totals["studentPeriods"] += absenceCount
+            metrics.count("emailsRendered")
+            metrics.count("bytesRendered", len(emailBodyHTML.encode()) + len(emailBodyText.encode()))
+            print(f"  {progressBar(totals['emails'], len(emailsList))} Sending email to {recipient}  {periodStudentStr}")
+            yield (recipient, emailSubject, emailBodyHTML, emailBodyText)
+    finally:
+        stopRendering.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+#################################################################
+### Email transports (how the emails get delivered)
+#################################################################
+# messages are (recipient, subject, emailBodyHTML, emailBodyText) tuples
+class EmailTransport:
+    name = "none"
+    isDryRun = False  # dry runs are not recorded in the job history
+
+    def send(self, recipient, subject, emailBodyHTML, emailBodyText):
+        raise NotImplementedError
+
+    # sends every message (messages can be any iterable, e.g. a generator) and returns the list of per-message send seconds
+    def sendAll(self, messages):
+        sendTimes = []
+        for message in messages:
+            startTime = time.perf_counter()
+            self.send(*message)
+            sendTimes.append(time.perf_counter() - startTime)
+        return sendTimes
+
+    def close(self):
+        pass
+
+# used when the platform has no Outlook to send with (and for benchmarking)
+class NullTransport(EmailTransport):
+    name = "none (emails are not sent)"
+    isDryRun = True
+
+    def send(self, recipient, subject, emailBodyHTML, emailBodyText):
+        pass
+
+# Uses one Outlook session for the whole run (Outlook.Application is only dispatched once), creates the MailItems
+# batchSize at a time and then sends them, retrying failed sends with exponential backoff. The batches are small
+# (about what the renderWorkers threads render at a time), so the first emails are sent while the later ones are still rendered.
+# dispatch() returns the Outlook application (any object with a CreateItem() method, e.g. the fake Outlook in
+# test_studentAbsenceEmailer.py for testing without Windows) and comErrors are the exceptions that are retried.
+class OutlookPCTransport(EmailTransport):
+    name = "Outlook (Windows)"
+
+    def __init__(self, outlook=None, retries=3, backoffSeconds=0.5, comErrors=None, dispatch=None, batchSize=renderWorkers):
+        self.outlook = outlook
+        self.batchSize = batchSize
+        self.retries = retries
+        self.backoffSeconds = backoffSeconds
+        self.comErrors = comErrors  # None = pywintypes.com_error
+        self.dispatch = dispatch  # None = win32com.client.Dispatch("Outlook.Application")
+
+    def getOutlook(self):
+        if self.outlook is None:
+            if self.dispatch:
+                self.outlook = self.dispatch()
+            else:
+                loadWin32com()  # not before the first email (keeps the startup fast)
+                self.outlook = win32com.client.Dispatch("Outlook.Application")
+        return self.outlook
+
+    def createMailItem(self, recipient, subject, emailBodyHTML):
+        mailItem = self.getOutlook().CreateItem(0)  # 0 = olMailItem
+        mailItem.To = recipient
+        mailItem.Subject = subject
+        mailItem.HTMLBody = emailBodyHTML
+        return mailItem
+
+    def sendMailItem(self, mailItem):
+        for attempt in range(self.retries + 1):
+            try:
+                mailItem.Send()  # SEND THE EMAIL
+                return
+            except (self.comErrors or com_error) as e:
+                if attempt == self.retries:
+                    raise
+                backoffSeconds = self.backoffSeconds * 2 ** attempt
+                print(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} Outlook could not send the email to {mailItem.To} ({e}). Retrying in {backoffSeconds:.1f} seconds.")
+                time.sleep(backoffSeconds)
+
+    def send(self, recipient, subject, emailBodyHTML, emailBodyText):
+        self.sendMailItem(self.createMailItem(recipient, subject, emailBodyHTML))
+
+    def sendAll(self, messages):
+        messagesIterator = iter(messages)
+        sendTimes = []
+        while True:
+            mailItems = [self.createMailItem(recipient, subject, emailBodyHTML)
+                         for recipient, subject, emailBodyHTML, emailBodyText in itertools.islice(messagesIterator, self.batchSize)]
+            if not mailItems:
+                return sendTimes
+            for mailItem in mailItems:
+                startTime = time.perf_counter()
+                self.sendMailItem(mailItem)
+                sendTimes.append(time.perf_counter() - startTime)
+
+    def close(self):
+        self.outlook = None
+
+# Outlook on a Mac only sends the text email
+class OutlookAppleTransport(EmailTransport):
+    name = "Outlook (Mac)"
+
+    def send(self, recipient, subject, emailBodyHTML, emailBodyText):
+        emailWithOutlookApple(recipient, subject, emailBodyText)
+
+def buildMimeMessage(fromAddress, recipient, subject, emailBodyHTML, emailBodyText):
+    from email.message import EmailMessage
+    message = EmailMessage()
+    message["From"] = fromAddress
+    message["To"] = recipient
+    message["Subject"] = subject
+    message.set_content(emailBodyText)
+    message.add_alternative(emailBodyHTML, subtype="html")
+    return message
+
+# dry run: the emails are written to a local maildir folder (readable by most mail programs) instead of being sent
+class MaildirTransport(EmailTransport):
+    name = "maildir (dry run)"
+    isDryRun = True
+
+    def __init__(self, maildirPath, fromAddress="sae@localhost"):
+        self.maildirPath = maildirPath
+        self.fromAddress = fromAddress
+        import mailbox
+        self.maildir = mailbox.Maildir(maildirPath, create=True)
+        self.name = f"maildir (dry run) {maildirPath}"
+
+    def send(self, recipient, subject, emailBodyHTML, emailBodyText):
+        self.maildir.add(buildMimeMessage(self.fromAddress, recipient, subject, emailBodyHTML, emailBodyText))
+
+# sends over a pool of up to 'concurrency' SMTP connections using asyncio (smtplib runs in worker threads),
+# never starting more than 'ratePerSecond' sends per second (0 = no limit)
+class SmtpTransport(EmailTransport):
+    def __init__(self, host, port=587, fromAddress=None, username=None, password=None, starttls=True, concurrency=4, ratePerSecond=0, timeout=30):
+        self.host = host
+        self.port = port
+        self.fromAddress = fromAddress or username
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.concurrency = max(1, concurrency)
+        self.ratePerSecond = ratePerSecond
+        self.timeout = timeout
+        self.connections = []  # idle connections (reused between sends)
+        self.connectionsLock = threading.Lock()
+        self.name = f"SMTP {host}:{port} ({self.concurrency} connections)"
+
+    def connect(self):
+        import smtplib
+        connection = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            connection.starttls()
+        if self.username:
+            connection.login(self.username, self.password)
+        return connection
+
+    def send(self, recipient, subject, emailBodyHTML, emailBodyText):
+        import smtplib
+        message = buildMimeMessage(self.fromAddress, recipient, subject, emailBodyHTML, emailBodyText)
+        with self.connectionsLock:
+            connection = self.connections.pop() if self.connections else None
+        if connection is None:
+            connection = self.connect()
+        try:
+            connection.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            connection = self.connect()  # server closed an idle connection, reconnect once
+            connection.send_message(message)
+        except Exception:
+            connection.close()
+            raise
+        with self.connectionsLock:
+            self.connections.append(connection)
+
+    def sendAll(self, messages):
+        import asyncio
+        return asyncio.run(self.sendAllAsync(messages))
+
+    async def sendAllAsync(self, messages):
+        import asyncio
+        import concurrent.futures
+        loop = asyncio.get_running_loop()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.concurrency + 1)
+        pending = asyncio.Queue(maxsize=self.concurrency)
+        sendTimes = []
+        nextSendTime = [loop.time()]
+        messagesIterator = iter(messages)
+
+        # messages may be a blocking generator, so it is only ever advanced by this one coroutine (in a thread)
+        async def feed():
+            while True:
+                message = await loop.run_in_executor(executor, next, messagesIterator, None)
+                if message is None:
+                    break
+                await pending.put(message)
+            for _ in range(self.concurrency):
+                await pending.put(None)
+
+        async def sender():
+            while True:
+                message = await pending.get()
+                if message is None:
+                    return
+                if self.ratePerSecond:
+                    sendTime = max(loop.time(), nextSendTime[0])
+                    nextSendTime[0] = sendTime + 1 / self.ratePerSecond
+                    await asyncio.sleep(sendTime - loop.time())
+                startTime = time.perf_counter()
+                await loop.run_in_executor(executor, self.send, *message)
+                sendTimes.append(time.perf_counter() - startTime)
+
+        try:
+            await asyncio.gather(feed(), *[sender() for _ in range(self.concurrency)])
+        finally:
+            executor.shutdown(wait=False)
+        return sendTimes
+
+    def close(self):
+        import smtplib
+        with self.connectionsLock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            try:
+                connection.quit()
+            except smtplib.SMTPException:
+                connection.close()
+
+def createTransport(args):
+    if args.transport == "smtp":
+        if not args.smtp_host:
+            sys.exit("--transport smtp needs --smtp-host")
+        return SmtpTransport(args.smtp_host, args.smtp_port, args.smtp_from, args.smtp_user, os.environ.get("SAE_SMTP_PASSWORD"),
+                             not args.smtp_no_starttls, args.concurrency, args.rate)
+    elif args.transport == "maildir":
+        return MaildirTransport(args.maildir or getAppDataFilePath("outbox"))
+    elif sys.platform == "win32":
+        return OutlookPCTransport()
+    elif sys.platform == "darwin":
+        return OutlookAppleTransport()
+    else:
+        return NullTransport()  # can not send (warning printed in main())
+
+# prints the send rate and adds the send latencies to the run metrics
+def recordSendRate(sendTimes, totalSeconds):
+    metrics.addSendTimes(sendTimes)
+    if sendTimes and totalSeconds > 0:
+        print(f"  Sent {len(sendTimes)} emails in {totalSeconds:.2f} seconds ({len(sendTimes) / totalSeconds:.1f} emails/second, "
+              f"{sum(sendTimes) / len(sendTimes):.3f} seconds/email average, {max(sendTimes):.3f} seconds slowest).")
+
+#################################################################
+### Job history (sqlite), so an event that is sent again only emails what changed (--delta)
+#################################################################
+# the job history keeps a student as one 'studentName_studentID' string (a student ID never has an '_', a name might)
+def encodeStudent(tableRow):
+    return tableRow[0] + "_" + tableRow[1]
+
+def decodeStudent(student):
+    studentName, _, studentID = student.rpartition("_")
+    return (studentName, studentID)
+
+# an absence is a (teacherEmail, dateStr, period, leaveReturnStr, timeStr, studentName_studentID) tuple
+def getAbsences(emails):
+    absences = set()
+    for teacherEmail, teacherDates in emails.items():
+        for dateStr, datePeriods in teacherDates.items():
+            for period, periodEntry in datePeriods.items():
+                leaveReturnStr, timeStr = periodEntry[0]
+                for tableRow in periodEntry[1:]:
+                    absences.add((teacherEmail, dateStr, period, leaveReturnStr, timeStr, encodeStudent(tableRow)))
+    return absences
+
+# the emails dictionary (same layout as groupAbsencesByTeacher() returns) for a set of absences
+def buildEmailsDict(absences):
+    emails = defaultdict(lambda: defaultdict(dict))
+    for teacherEmail, dateStr, period, leaveReturnStr, timeStr, student in sorted(absences, key=str):
+        emails[teacherEmail][dateStr].setdefault(period, [(leaveReturnStr, timeStr)]).append(decodeStudent(student))
+    return emails
+
+class JobStore:
+    def __init__(self, jobStorePath):
+        import sqlite3
+        self.connection = sqlite3.connect(jobStorePath)
+        self.connection.executescript("""
+            CREATE TABLE IF NOT EXISTS events (eventKey TEXT PRIMARY KEY, subject TEXT, lastSent TEXT);
+            CREATE TABLE IF NOT EXISTS absences (eventKey TEXT, teacherEmail TEXT, dateStr TEXT, period TEXT, leaveReturn TEXT, time TEXT, student TEXT);
+            CREATE INDEX IF NOT EXISTS absencesEventKey ON absences (eventKey);
+            CREATE TABLE IF NOT EXISTS sends (eventKey TEXT, teacherEmail TEXT, sentAt TEXT, transport TEXT);
+        """)
+
+    # when the event was last sent (None if it was never sent)
+    def getLastSent(self, eventKey):
+        row = self.connection.execute("SELECT lastSent FROM events WHERE eventKey = ?", (eventKey,)).fetchone()
+        return row[0] if row else None
+
+    def getAbsences(self, eventKey):
+        return set(self.connection.execute("SELECT teacherEmail, dateStr, period, leaveReturn, time, student FROM absences WHERE eventKey = ?", (eventKey,)))
+
+    # replaces the event's absences with the ones that were just sent and records who they were sent to
+    def saveEvent(self, eventKey, subject, absences, teacherEmails, transportName):
+        sentAt = datetime.now().isoformat(timespec="seconds")
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO events VALUES (?, ?, ?)", (eventKey, subject, sentAt))
+            self.connection.execute("DELETE FROM absences WHERE eventKey = ?", (eventKey,))
+            self.connection.executemany("INSERT INTO absences VALUES (?, ?, ?, ?, ?, ?, ?)", [(eventKey,) + absence for absence in absences])
+            self.connection.executemany("INSERT INTO sends VALUES (?, ?, ?, ?)", [(eventKey, teacherEmail, sentAt, transportName) for teacherEmail in teacherEmails])
+
+    # every stored absence with its event, (eventKey, subject, lastSent, teacherEmail, dateStr, period, leaveReturn, time, student) rows
+    def getAllAbsences(self):
+        return self.connection.execute("SELECT events.eventKey, subject, lastSent, teacherEmail, dateStr, period, leaveReturn, time, student "
+                                       "FROM absences JOIN events ON absences.eventKey = events.eventKey")
+
+    def close(self):
+        self.connection.close()
+
+# the emailsList to send for an event: all the absences, or with delta only the absences added/removed since the event was last sent
+def getEventEmailsList(jobStore, eventKey, emails, delta):
+    lastSent = jobStore.getLastSent(eventKey)
+    if not delta or lastSent is None:
+        return buildEmailsList(emails)
+    absences = getAbsences(emails)
+    previousAbsences = jobStore.getAbsences(eventKey)
+    addedAbsences = absences - previousAbsences
+    removedAbsences = previousAbsences - absences
+    emailsList = buildEmailsList(buildEmailsDict(addedAbsences), buildEmailsDict(removedAbsences))
+    print(f"  Only sending changes since {lastSent}: {len(addedAbsences)} added and {len(removedAbsences)} removed student-periods for {len(emailsList)} teachers.")
+    return emailsList
+
+#################################################################
+### Batch (headless) mode
+#################################################################
+# A job file is a json file with one event (or {"events": [event, ...]}), a job directory holds any number of job files.
+#   {"subject": "Robotics competition",
+#    "dates": ["04/17/25", "04/18/25 5leaving@1:30pm"],
+#    "studentIDs": ["1234567", "2345678"],
+#    "message": "Good luck to our team!",            (a string or a list of lines)
+#    "onBehalfOf": "Ms. Smith",                      (optional)
+#    "testEmail": "smith@austinisd.org",             (optional)
+#    "dayTypes": {"04/18/25": "b"},                  ('a' or 'b' for every date in XDays)
+#    "eventID": "robotics-state",                    (optional, job history key, default: the subject)
+#    "delta": true}                                  (optional, overrides --delta for this event)
+# With --digest all the events of the run are merged so every teacher gets one email listing each event (testEmail is ignored).
+# Returns (events, jobErrors) where jobErrors are the run summary entries of the job files (or events) that could not be read,
+# so one bad job file does not stop the whole batch.
+def readJobEvents(jobPath):
+    if os.path.isdir(jobPath):
+        jobFiles = sorted(str(path) for path in Path(jobPath).glob("*.json"))
+    else:
+        jobFiles = [jobPath]
+    events = []
+    jobErrors = []
+    for jobFile in jobFiles:
+        try:
+            with open(jobFile, encoding='utf-8') as f:
+                job = json.load(f)
+            if not isinstance(job, dict):
+                raise ValueError("a job file has to be a json object")
+            jobEvents = job["events"] if "events" in job else [job]
+            if not isinstance(jobEvents, list):
+                raise ValueError('"events" has to be a list')
+        except (OSError, ValueError) as e:  # json.JSONDecodeError is a ValueError
+            jobErrors.append({"jobFile": jobFile, "status": "error", "error": f"{type(e).__name__}: {e}"})
+            continue
+        for eventNumber, event in enumerate(jobEvents, 1):
+            if not isinstance(event, dict):
+                jobErrors.append({"jobFile": jobFile, "status": "error", "error": f"ValueError: event {eventNumber} is not a json object"})
+                continue
+            event.setdefault("jobFile", jobFile)
+            events.append(event)
+    return events, jobErrors
+
+# the errors that skip an event in batch mode (instead of stopping the whole batch)
+def getEventErrors():
+    import smtplib
+    import sqlite3
+    return (KeyError, ValueError, TypeError, AttributeError, OSError, smtplib.SMTPException, sqlite3.Error, com_error)
+
+def recordEventError(summary, e):
+    summary["status"] = "error"
+    summary["error"] = f"{type(e).__name__}: {e}"
+    print(f'{bcolors.RED}Warning!!!{bcolors.ENDC} Skipping event {summary["subject"]} ({summary["error"]}).')
+
+# parses and groups one event without any prompts (raises one of the getEventErrors() for an invalid event), returns the preparedEvent dictionary
+def prepareEvent(event, students, todaysDate, jobStore, delta, summary):
+    with metrics.stage("parseDates"):
+        dates, classDatePeriods, periodsMissedCount = parseEventDates(event, todaysDate, summary)
+    emailSubject = '[SAE] ' + event["subject"].strip()
+    studentIDs = list(dict.fromkeys(str(studentID).strip() for studentID in event["studentIDs"] if str(studentID).strip()))
+    with metrics.stage("groupAbsences"):
+        emails, studentsNotFound = groupAbsencesByTeacher(students, studentIDs, dates, classDatePeriods)
+    summary["studentsNotFound"] = list(studentsNotFound)
+    for key in studentsNotFound:
+        print(f'{bcolors.RED}Warning!!!{bcolors.ENDC} Student ID {key} was not found in {csvStudentsFile}!!!')
+    message = event.get("message", "")
+    eventKey = event.get("eventID", emailSubject)
+    summary.update(students=len(studentIDs), periodsMissed=periodsMissedCount)
+    with metrics.stage("jobHistory"):
+        emailsList = getEventEmailsList(jobStore, eventKey, emails, event.get("delta", delta))
+    return {
+        "eventKey": eventKey,
+        "subject": event["subject"].strip(),
+        "emailSubject": emailSubject,
+        "emailMessage": message if isinstance(message, str) else "\n".join(message),
+        "onBehalfOfName": event.get("onBehalfOf", "").strip(),
+        "emails": emails,
+        "emailsList": emailsList,
+    }
+
+# returns expandDatePeriods() of the event's date lines and dayTypes (raises ValueError for invalid date lines)
+def parseEventDates(event, todaysDate, summary):
+    dateSlots = []
+    summary["invalidDateLines"] = []
+    for line in (line.strip() for line in event["dates"]):
+        if line:
+            try:
+                dateSlots.append(parseDateLine(line))
+            except DateLineError as e:
+                summary["invalidDateLines"].append({"line": line, "position": e.position + 1, "error": e.message})
+    if summary["invalidDateLines"]:
+        raise ValueError(f'invalid date lines {[invalid["line"] for invalid in summary["invalidDateLines"]]}')
+    dayTypes = {parseDateLine(dateStr.strip()).firstDate: dayType.strip().lower() for dateStr, dayType in event.get("dayTypes", {}).items()}
+    def getDayType(dayOfTheWeek, dateStr):
+        dayType = dayTypes.get(datetime.strptime(dateStr, "%m/%d/%y").date())
+        if dayType not in ("a", "b"):
+            raise ValueError(f"dayTypes needs 'a' or 'b' for {dayOfTheWeek} {dateStr}")
+        return dayType
+    return expandDatePeriods(dateSlots, todaysDate, getDayType)
+
+# records a sent event in the job history (dry runs are not recorded)
+def saveEvent(jobStore, transport, preparedEvent):
+    if not transport.isDryRun:
+        with metrics.stage("jobHistory"):
+            jobStore.saveEvent(preparedEvent["eventKey"], preparedEvent["emailSubject"], getAbsences(preparedEvent["emails"]),
+                               [emailList[0] for emailList in preparedEvent["emailsList"]], transport.name)
+
+# process one event without any prompts, returns its summary dictionary
+def runEvent(event, students, todaysDate, transport, jobStore, delta=False):
+    summary = {"jobFile": event.get("jobFile"), "subject": event.get("subject", ""), "status": "ok"}
+    try:
+        preparedEvent = prepareEvent(event, students, todaysDate, jobStore, delta, summary)
+        emailsList = preparedEvent["emailsList"]
+        renderEmail = lambda emailList: renderTeacherEmail(emailList, preparedEvent["emailMessage"], preparedEvent["onBehalfOfName"])
+        if emailsList and event.get("testEmail"):
+            emailBodyHTML, emailBodyText, periodStudentStr, absenceCount = renderEmail(emailsList[0])
+            print(f'Sending a test email to {event["testEmail"]}.')
+            transport.send(event["testEmail"], preparedEvent["emailSubject"], emailBodyHTML, emailBodyText)
+        totals = {"emails": 0, "studentPeriods": 0}
+        startTime = time.perf_counter()
+        with metrics.stage("send"):
+            sendTimes = transport.sendAll(renderedMessages(emailsList, preparedEvent["emailSubject"], renderEmail, totals))
+        recordSendRate(sendTimes, time.perf_counter() - startTime)
+        saveEvent(jobStore, transport, preparedEvent)
+        summary.update(emailsSent=len(sendTimes), studentPeriods=totals["studentPeriods"])
+    except getEventErrors() as e:
+        recordEventError(summary, e)
+    return summary
+
+# one email per teacher for all the events, digestEmailsList = [[teacherEmail, [(preparedEvent, emailList), ...]], ...]
+def mergeEventEmailsLists(preparedEvents):
+    teacherEvents = defaultdict(list)
+    for preparedEvent in preparedEvents:
+        for emailList in preparedEvent["emailsList"]:
+            teacherEvents[emailList[0]].append((preparedEvent, emailList))
+    return [[teacherEmail, teacherEvents[teacherEmail]] for teacherEmail in sorted(teacherEvents)]
+
+# digest mode: every teacher gets a single email covering all the events, returns (eventSummaries, digestEmailsSent)
+def runDigest(events, students, todaysDate, transport, jobStore, delta, digestSubject):
+    eventSummaries = []
+    preparedEvents = []
+    for event in events:
+        print(f'\nEvent {event.get("subject", "")} ({event["jobFile"]})')
+        summary = {"jobFile": event.get("jobFile"), "subject": event.get("subject", ""), "status": "ok"}
+        eventSummaries.append(summary)
+        try:
+            preparedEvent = prepareEvent(event, students, todaysDate, jobStore, delta, summary)
+            preparedEvents.append((preparedEvent, summary))
+            summary.update(teachers=len(preparedEvent["emailsList"]),
+                           studentPeriods=sum(countTeacherAbsences(emailList)[1] for emailList in preparedEvent["emailsList"]))
+        except getEventErrors() as e:
+            recordEventError(summary, e)
+    digestEmailsList = mergeEventEmailsLists([preparedEvent for preparedEvent, summary in preparedEvents])
+    separateEmailCount = sum(len(preparedEvent["emailsList"]) for preparedEvent, summary in preparedEvents)
+    print(f"\nDigest: {len(digestEmailsList)} emails instead of {separateEmailCount} separate emails.")
+    totals = {"emails": 0, "studentPeriods": 0}
+    startTime = time.perf_counter()
+    try:
+        with metrics.stage("send"):
+            sendTimes = transport.sendAll(renderedMessages(digestEmailsList, '[SAE] ' + digestSubject, renderDigestEmail, totals))
+        recordSendRate(sendTimes, time.perf_counter() - startTime)
+        for preparedEvent, summary in preparedEvents:
+            saveEvent(jobStore, transport, preparedEvent)
+    except getEventErrors() as e:
+        for preparedEvent, summary in preparedEvents:
+            recordEventError(summary, e)
+        sendTimes = []
+    return eventSummaries, len(sendTimes)
+
+# process every event in the job file/directory reusing the loaded students, returns the run summary dictionary.
+# With a digestSubject all the events are sent as one digest email per teacher (test emails are not sent).
+def runBatch(jobPath, students, transport, jobStore, delta=False, digestSubject=None):
+    todaysDate = date.today()
+    events, jobErrors = readJobEvents(jobPath)
+    for jobError in jobErrors:
+        print(f'{bcolors.RED}Warning!!!{bcolors.ENDC} Skipping job file {jobError["jobFile"]} ({jobError["error"]}).')
+    if digestSubject:
+        eventSummaries, emailsSent = runDigest(events, students, todaysDate, transport, jobStore, delta, digestSubject)
+    else:
+        eventSummaries = []
+        for event in events:
+            print(f'\nEvent {event.get("subject", "")} ({event["jobFile"]})')
+            eventSummaries.append(runEvent(event, students, todaysDate, transport, jobStore, delta))
+        emailsSent = sum(eventSummary.get("emailsSent", 0) for eventSummary in eventSummaries)
+    eventSummaries = jobErrors + eventSummaries
+    return {
+        "version": version,
+        "events": eventSummaries,
+        "emailsSent": emailsSent,
+        "digest": bool(digestSubject),
+        "errors": sum(eventSummary["status"] != "ok" for eventSummary in eventSummaries),
+        "transport": transport.name,
+    }
+
+#################################################################
+### Query mode (answers teacher, student, event and date questions from the roster and the job history, nothing is sent)
+#################################################################
+queryKinds = ["teacher", "student", "event", "dates"]
+reportColumns = ["Event", "Teacher Email", "Date", "Period", "Leaving/Returning", "Time", "Student Name", "Student ID"]
+
+# The indexes are built with one pass over the roster and one pass over the stored absences, after that every query
+# only looks at the absences it returns. An entry is an (eventKey, absence) tuple (absence as getAbsences() returns).
+class QueryIndex:
+    def __init__(self, students, eventAbsences):
+        self.students = students
+        self.teacherPeriods = defaultdict(lambda: defaultdict(list))  # teacherEmail -> period -> [studentID, ...]
+        for studentID, student in students.items():
+            for period, teacherEmail in student.periods():
+                self.teacherPeriods[teacherEmail][period].append(studentID)
+        self.events = {}  # eventKey -> (subject, lastSent)
+        self.byEvent = defaultdict(list)
+        self.byTeacher = defaultdict(list)
+        self.byStudent = defaultdict(list)
+        self.byDate = defaultdict(list)
+        self.absenceDates = {}  # dateStr -> date
+        for eventKey, subject, lastSent, teacherEmail, dateStr, period, leaveReturnStr, timeStr, student in eventAbsences:
+            self.events[eventKey] = (subject, lastSent)
+            entry = (eventKey, (teacherEmail, dateStr, period, leaveReturnStr, timeStr, student))
+            if dateStr not in self.absenceDates:
+                self.absenceDates[dateStr] = datetime.strptime(dateStr, "%m/%d/%y").date()
+            self.byEvent[eventKey].append(entry)
+            self.byTeacher[teacherEmail].append(entry)
+            self.byStudent[decodeStudent(student)[1]].append(entry)
+            self.byDate[self.absenceDates[dateStr]].append(entry)
+
+    # the eventKeys of the events with this eventID or subject (with or without '[SAE] ')
+    def findEvents(self, value):
+        return [eventKey for eventKey, (subject, lastSent) in self.events.items() if value in (eventKey, subject, subject[len("[SAE] "):])]
+
+    # the entries of one query, dateSlot (a parsed 'mm/dd/yy[-mm/dd/yy]' date line) only keeps the absences on its dates
+    def query(self, kind, value, dateSlot=None):
+        if kind == "teacher":
+            entries = self.byTeacher.get(value, [])
+        elif kind == "student":
+            entries = self.byStudent.get(value, [])
+        elif kind == "event":
+            entries = [entry for eventKey in self.findEvents(value) for entry in self.byEvent[eventKey]]
+        else:
+            valueSlot = parseDateLine(value)
+            firstDate, lastDate = valueSlot.firstDate, valueSlot.lastDate
+            if dateSlot:  # only the dates in both ranges
+                firstDate, lastDate = max(firstDate, dateSlot.firstDate), min(lastDate, dateSlot.lastDate)
+                dateSlot = None
+            entries = [entry for dateObject in getDateRange(firstDate, lastDate) for entry in self.byDate.get(dateObject, [])]
+        if dateSlot:
+            entries = [entry for entry in entries if dateSlot.firstDate <= self.absenceDates[entry[1][1]] <= dateSlot.lastDate]
+        return entries
+
+    # the emailsList (sorted by teacher, date and period) of every event in the entries, [(eventKey, emailsList), ...] sorted by subject
+    def getEventEmailsLists(self, entries):
+        eventAbsences = defaultdict(set)
+        for eventKey, absence in entries:
+            eventAbsences[eventKey].add(absence)
+        return [(eventKey, buildEmailsList(buildEmailsDict(eventAbsences[eventKey]))) for eventKey in sorted(eventAbsences, key=lambda eventKey: self.events[eventKey])]
+
+    # one row (reportColumns) per student-period in emailsList order
+    def getReportRows(self, entries):
+        rows = []
+        for eventKey, emailsList in self.getEventEmailsLists(entries):
+            for teacherEmail, dateList, removedDateList in emailsList:
+                for dateStr, periodList in dateList:
+                    for period, periodEntry in periodList:
+                        leaveReturnStr, timeStr = periodEntry[0]
+                        for studentName, studentID in sorted(periodEntry[1:]):
+                            rows.append([self.events[eventKey][0], teacherEmail, dateStr, period, leaveReturnStr or "", timeStr or "", studentName, studentID])
+        return rows
+
+    # the roster lines printed above the absences of a teacher or student query
+    def getRosterLines(self, kind, value):
+        if kind == "teacher":
+            periods = self.teacherPeriods.get(value, {})
+            return [f"{value} has {sum(len(studentIDs) for studentIDs in periods.values())} students: " +
+                    " ".join(f"Period {period}({len(periods[period])})" for period in periodSlots if period in periods)]
+        if kind == "student":
+            if value not in self.students:
+                return [f"Student ID {value} was not found in {csvStudentsFile}."]
+            student = self.students[value]
+            return [f"{student.name} {student.id}"] + [f"  Period {period:4} {teacherEmail}" for period, teacherEmail in student.periods()]
+        if kind == "event":
+            return [f"{self.events[eventKey][0]} (last sent {self.events[eventKey][1]}) affects {len(emailsList)} teachers"
+                    for eventKey, emailsList in self.getEventEmailsLists(self.query(kind, value))]
+        return []
+
+# writes the report rows to a .csv file or (any other suffix) an html file rendered with the report.html template
+def writeReport(reportPath, title, rows):
+    if reportPath.lower().endswith(".csv"):
+        with open(reportPath, "w", newline='', encoding='utf-8') as csvfile:
+            csvWriter = csv.writer(csvfile)
+            csvWriter.writerow(reportColumns)
+            csvWriter.writerows(rows)
+    else:
+        reportHTML = getTemplateEnvironment().get_template("report.html").render(title=title, columns=reportColumns, rows=rows)
+        with open(reportPath, "w", encoding='utf-8') as f:
+            f.write(reportHTML)
+
+# the parsed --dates date line (None without --dates), checked together with the dates of a dates query before the roster is loaded
+def parseQueryDates(args):
+    kind, value = args.query
+    try:
+        if kind == "dates":
+            parseDateLine(value)
+        return parseDateLine(args.dates) if args.dates else None
+    except DateLineError as e:
+        sys.exit(f"Invalid date\n{e.showPosition('  ')}")
+
+def runQuery(args, students, jobStore, dateSlot):
+    kind, value = args.query
+    with metrics.stage("queryIndex"):
+        startTime = time.perf_counter()
+        queryIndex = QueryIndex(students, jobStore.getAllAbsences())
+        indexSeconds = time.perf_counter() - startTime
+    with metrics.stage("query"):
+        startTime = time.perf_counter()
+        rows = queryIndex.getReportRows(queryIndex.query(kind, value, dateSlot))
+        rosterLines = queryIndex.getRosterLines(kind, value)
+        querySeconds = time.perf_counter() - startTime
+    for line in rosterLines:
+        print(line)
+    widths = [max([len(column)] + [len(row[i]) for row in rows]) for i, column in enumerate(reportColumns)]
+    for row in [reportColumns] + rows:
+        print("  ".join(f"{cell:{width}}" for cell, width in zip(row, widths)))
+    print(f"{len(rows)} student-periods from {len(queryIndex.events)} sent events (index built in {indexSeconds * 1000:.1f} ms, query answered in {querySeconds * 1000:.1f} ms).")
+    if args.report:
+        title = f"SAE {kind} {value}" + (f" {args.dates}" if args.dates else "")
+        writeReport(args.report, title, rows)
+        print(f"Report saved to {args.report}")
+
+#################################################################
+### Run metrics (stage timers and counters, written to metricsFile at the end of every run)
+#################################################################
+class RunMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()  # the render stage runs in the render worker threads
+        self.startTime = time.perf_counter()
+        self.stages = {}  # stage -> {"calls": n, "wallSeconds": s, "cpuSeconds": s}
+        self.counters = defaultdict(int)
+        self.sendTimes = []
+
+    # with metrics.stage("name"): adds the wall seconds and the CPU seconds of the calling thread to the stage.
+    # The render stage overlaps the send stage (rendering runs ahead of the transport in worker threads).
+    @contextlib.contextmanager
+    def stage(self, name):
+        wallStart = time.perf_counter()
+        cpuStart = time.thread_time()
+        try:
+            yield
+        finally:
+            wallSeconds = time.perf_counter() - wallStart
+            cpuSeconds = time.thread_time() - cpuStart
+            with self.lock:
+                stage = self.stages.setdefault(name, {"calls": 0, "wallSeconds": 0.0, "cpuSeconds": 0.0})
+                stage["calls"] += 1
+                stage["wallSeconds"] += wallSeconds
+                stage["cpuSeconds"] += cpuSeconds
+
+    def count(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def addSendTimes(self, sendTimes):
+        with self.lock:
+            self.sendTimes.extend(sendTimes)
+
+    # send latency percentiles (nearest rank) in seconds
+    def getSendLatency(self):
+        sendTimes = sorted(self.sendTimes)
+        if not sendTimes:
+            return {"count": 0}
+        percentile = lambda p: sendTimes[min(len(sendTimes) - 1, max(0, round(p / 100 * len(sendTimes)) - 1))]
+        return {"count": len(sendTimes), "p50": percentile(50), "p90": percentile(90), "p99": percentile(99), "max": sendTimes[-1]}
+
+    def toDict(self):
+        return {
+            "version": version,
+            "date": datetime.now().isoformat(timespec="seconds"),
+            "totalWallSeconds": time.perf_counter() - self.startTime,
+            "totalCpuSeconds": time.process_time(),
+            "stages": self.stages,
+            "counters": dict(self.counters),
+            "sendLatencySeconds": self.getSendLatency(),
+        }
+
+    def printReport(self):
+        print(f"\n{'stage':16} {'calls':>6} {'wall seconds':>13} {'cpu seconds':>12}")
+        for name, stage in self.stages.items():
+            print(f"{name:16} {stage['calls']:>6} {stage['wallSeconds']:>13.3f} {stage['cpuSeconds']:>12.3f}")
+        for name, value in self.counters.items():
+            print(f"{name:28} {value:>12}")
+        sendLatency = self.getSendLatency()
+        if sendLatency["count"]:
+            print("send latency   " + "  ".join(f"{name} {sendLatency[name]:.3f}s" for name in ("p50", "p90", "p99", "max")))
+
+    def write(self, path):
+        try:
+            with open(path, "w", encoding='utf-8') as f:
+                json.dump(self.toDict(), f, indent=2)
+        except OSError as e:
+            print(f'{bcolors.RED}Warning!!!{bcolors.ENDC} Could not write metrics file {path} ({e}).')
+
+metrics = RunMetrics()
+
+def parseArguments():
+    parser = argparse.ArgumentParser(description="Student Absence Emailer (SAE)")
+    parser.add_argument("--rebuild-cache", action="store_true", help=f"re-read {csvStudentsFile} even if the roster cache is up to date")
+    parser.add_argument("--loader", choices=["csv", "pandas", "stream"], default="csv",
+                        help="how to read the csv file when the roster cache is out of date (pandas is faster for large files, "
+                             "stream only reads the entered students and skips the roster cache)")
+    parser.add_argument("--roster", metavar="PATH", help=f"roster csv file, folder of csv files (e.g. one per campus) or glob pattern (default: {csvStudentsFile})")
+    parser.add_argument("--workers", type=int, help="number of processes reading the roster csv files in parallel (default: one per CPU, 1 = one file after the other)")
+    parser.add_argument("--job", metavar="PATH", help="batch mode: send the events in this json job file (or directory of job files) without any prompts")
+    parser.add_argument("--summary", metavar="FILE", help="batch mode: write the json summary to FILE instead of stdout")
+    parser.add_argument("--digest", metavar="SUBJECT", help="batch mode: send each teacher one email (with this subject) covering all the events")
+    parser.add_argument("--delta", action="store_true", help="only email the students added/removed since an event with the same subject was last sent")
+    parser.add_argument("--transport", choices=["outlook", "smtp", "maildir"], default="outlook", help="how to deliver the emails (default: Outlook)")
+    parser.add_argument("--maildir", metavar="PATH", help="maildir transport: folder the emails are written to (default: outbox in the SAE data folder)")
+    parser.add_argument("--smtp-host", help="smtp transport: server host name")
+    parser.add_argument("--smtp-port", type=int, default=587, help="smtp transport: server port (default: 587)")
+    parser.add_argument("--smtp-user", help="smtp transport: login user name (password is read from the SAE_SMTP_PASSWORD environment variable)")
+    parser.add_argument("--smtp-from", help="smtp transport: From address (default: the login user name)")
+    parser.add_argument("--smtp-no-starttls", action="store_true", help="smtp transport: do not use STARTTLS")
+    parser.add_argument("--concurrency", type=int, default=4, help="smtp transport: number of connections sending at the same time (default: 4)")
+    parser.add_argument("--profile", action="store_true", help=f"print the stage timings and counters and save a cProfile dump (main thread) to {profileFile} in the SAE data folder")
+    parser.add_argument("--metrics", metavar="FILE", help=f"write the run metrics json to FILE (default: {metricsFile} in the SAE data folder)")
+    parser.add_argument("--rate", type=float, default=0, help="smtp transport: maximum emails per second (default: no limit)")
+    parser.add_argument("--query", nargs=2, metavar=("KIND", "VALUE"),
+                        help="query mode: list the absences of the sent events for a teacher EMAIL, a student ID, an event SUBJECT (or eventID) "
+                             f"or mm/dd/yy[-mm/dd/yy] dates (KIND: {', '.join(queryKinds)}), nothing is sent")
+    parser.add_argument("--dates", metavar="mm/dd/yy[-mm/dd/yy]", help="query mode: only the absences on these dates (e.g. this week, "
+                                                                        "with a dates query: the dates in both ranges)")
+    parser.add_argument("--report", metavar="FILE", help="query mode: also save the absences to FILE (.csv, otherwise html)")
+    args = parser.parse_args()
+    if args.query and args.query[0] not in queryKinds:
+        parser.error(f"argument --query: invalid KIND '{args.query[0]}' (choose from {', '.join(queryKinds)})")
+    return args
+
+def getRosterPath(args):
+    return args.roster or get_data_file_path(csvStudentsFile)
+
+# the whole SAE run (batch or interactive), main() adds the metrics and profiling around it
+def runSAE(args):
+    if args.query:
+        dateSlot = parseQueryDates(args)
+        with metrics.stage("loadRoster"):
+            students = loadStudents(getRosterPath(args), args.rebuild_cache, args.loader, args.workers)
+        jobStore = JobStore(getAppDataFilePath(jobStoreFile))
+        try:
+            runQuery(args, students, jobStore, dateSlot)
+        finally:
+            jobStore.close()
+        sys.exit()
+
+    if args.job:
+        # in batch mode stdout is reserved for the json summary, progress goes to stderr
+        with contextlib.redirect_stdout(sys.stderr):
+            with metrics.stage("loadRoster"):
+                if args.loader == "stream":
+                    studentIDs = {str(studentID).strip() for event in readJobEvents(args.job)[0] if isinstance(event.get("studentIDs"), list) for studentID in event["studentIDs"]}
+                    students = loadStudentsForIDs(getRosterPath(args), studentIDs, args.workers)
+                else:
+                    students = loadStudents(getRosterPath(args), args.rebuild_cache, args.loader, args.workers)
+                loadSchoolCalendar()
+            transport = createTransport(args)
+            jobStore = JobStore(getAppDataFilePath(jobStoreFile))
+            try:
+                runSummary = runBatch(args.job, students, transport, jobStore, args.delta, args.digest)
+            finally:
+                transport.close()
+                jobStore.close()
+        if args.summary:
+            with open(args.summary, "w", encoding='utf-8') as f:
+                json.dump(runSummary, f, indent=2)
+        else:
+            print(json.dumps(runSummary, indent=2))
+        sys.exit(1 if runSummary["errors"] else 0)
+
+    print(f'Version {version} ({versionDate}) for the 2024-25 school year.')
+    print(f'Documentation at https://tinyurl.com/LASAStudentAbsenceEmailer')
+    #print(f'Reading in {csvStudentsFile} file')
+
+    transport = createTransport(args)
+    if isinstance(transport, NullTransport):
+        print(f'{bcolors.RED}Warning!!!{bcolors.ENDC} Can not determine if running on a Windows PC or a Mac.')               
+        
+    
+    #################################################################
+    ### read data from spreadsheet's csv file (or its compiled cache)
+    #################################################################
+    cvsPath = getRosterPath(args)
+    for rosterFilePath in getRosterPaths(cvsPath):
+        cvsFileDateTime = datetime.fromtimestamp(Path(rosterFilePath).stat().st_mtime)
+        if not is_between_prior_aug_and_upcoming_june(cvsFileDateTime):
+            print(f'{bcolors.RED}Warning!!!{bcolors.ENDC} {os.path.basename(rosterFilePath)} from {cvsFileDateTime.strftime("%b %d, %Y")} is not for this school year.')
+    with metrics.stage("loadRoster"):
+        if args.loader != "stream":  # streamed once the student IDs are entered
+            students = loadStudents(cvsPath, args.rebuild_cache, args.loader, args.workers)
+        loadSchoolCalendar()
     # pprint(students)
 
     #################################################################
@@ -198,94 +1785,25 @@ def main():
     #################################################################
     ### Dates, Periods, and optional time(s)
     #################################################################
-    print(f"\n{bcolors.BOLD}Enter mm/dd/yy #,#,#,# below (# = 1-8 or Adv).{bcolors.ENDC}")
+    print(f"\n{bcolors.BOLD}Enter mm/dd/yy #,#,#,# below (# = 1-8 or Adv, mm/dd/yy-mm/dd/yy for several days).{bcolors.ENDC}")
     print("Press <ENTER> on an empty line to finish.")
-    lines = []
+    dateSlots = []
     todaysDate = date.today()
     while True:
         line = input().strip()
-        matchResponse = re.match(r"^(0?[1-9]|1[0-2])/(0?[1-9]|[12][0-9]|3[01])/\d{2}(?: ([1-8]|Adv|adv)((leaving|returning)@(0?[1-9]|1[0-2]):[0-5][0-9](am|pm|AM|PM))?(,([1-8]|Adv|adv)((leaving|returning)@(0?[1-9]|1[0-2]):[0-5][0-9](am|pm|AM|PM))?)*)?$", line)
         if line:
-            if matchResponse:
-                lines.append(line)
-            else:
+            try:
+                with metrics.stage("parseDates"):
+                    dateSlots.append(parseDateLine(line))
+            except DateLineError as e:
                 print(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} Disregarding invalid input {bcolors.RED}{line}{bcolors.ENDC}")
+                print(e.showPosition("    "))
         else:
             break
-    dates = []
-    classDatePeriods = []
-    periodsMissedCount = 0
-    for datePeriod in lines:
-        if " " in datePeriod:
-            dateStr, periodAndTime = datePeriod.split()
-        else:
-            dateStr = datePeriod
-            periodAndTime = None
-        dateTimeObject = datetime.strptime(dateStr, "%m/%d/%y")  # Convert to datetime object
-        dayOfTheWeek = dateTimeObject.strftime("%A")
-        dateObject = dateTimeObject.date()
-        daysFromNow = (dateObject - todaysDate).days
-        if not periodAndTime:  # periodAndTime == None
-            if dayOfTheWeek in XDays:
-                while True:
-                    response = input(f"  Is {dayOfTheWeek} {dateStr} an A-day or a B-day (answer 'a' or 'b')? ").strip().lower()
-                    if response == "a":
-                        periodAndTime = periodsAdvADay
-                        break
-                    elif response == "b":
-                        periodAndTime = periodsAdvBDay
-                        break
-                    else:
-                        print("  Please respond with either 'a' or 'b'.")
-            elif dayOfTheWeek in ADays:
-                periodAndTime = periodsADay
-            elif dayOfTheWeek in BDays:
-                periodAndTime = periodsBDay
-        pts = periodAndTime.split(",")
-        # handle only 1 period being entered
-        if len(pts) == 1:
-            onlyPeriod = pts[0].split('@')[0].strip("leaving")
-            if dayOfTheWeek in XDays:
-                while True:
-                    response = input(f"  Is {dayOfTheWeek} {dateStr} an A-day or a B-day (answer 'a' or 'b')? ").strip().lower()
-                    if response == "a":
-                        periodAndTime = periodsAdvADay[periodsAdvADay.find(onlyPeriod):]
-                        break
-                    elif response == "b":
-                        periodAndTime = periodsAdvBDay[periodsAdvBDay.find(onlyPeriod):]
-                        break
-                    else:
-                        print("  Please respond with either 'a' or 'b'.")
-            elif dayOfTheWeek in ADays:
-                periodAndTime = periodsADay[periodsADay.find(onlyPeriod):]
-            elif dayOfTheWeek in BDays:
-                periodAndTime = periodsBDay[periodsBDay.find(onlyPeriod):]
-            periodAndTime = periodAndTime.replace(onlyPeriod,pts[0])   # put the leaving@ or returning@ back in
-        pts = periodAndTime.split(",")
-        periodsMissedCount += len(pts)
-        periodsStr = ""
-        printPeriodsStr = ""
-        datePeriods = []
-        for pt in pts:
-            leaveReturnStr = None
-            timeStr = None
-            if pt.find("@") != -1:
-                periodLeaveReturnStr, timeStr = pt.split("@")
-                matchResponse = re.match(r"^(\w+)(leaving|returning)$", periodLeaveReturnStr)
-                periodStr = matchResponse.group(1)
-                leaveReturnStr = matchResponse.group(2)
-            else:
-                periodStr = pt                     
-            datePeriods.append((periodStr, leaveReturnStr, timeStr))
-            if leaveReturnStr:
-                printPeriodsStr += f"{periodStr}({leaveReturnStr} at {timeStr}) "
-            else:
-                printPeriodsStr += f"{periodStr} "
-        print(
-            f'  in {daysFromNow} day{"s" if daysFromNow > 1 else ""}, on {dayOfTheWeek} {dateStr}, periods: {printPeriodsStr}'
-        )
-        dates.append(dateStr)
-        classDatePeriods.append(datePeriods)
+    dates, classDatePeriods, periodsMissedCount = expandDatePeriods(dateSlots, todaysDate)
+    if not periodsMissedCount:
+        print(f"  {bcolors.RED}Warning!!!{bcolors.ENDC} None of the entered dates is a school day. Exiting program!!!")
+        sys.exit()
 
     #################################################################
     ### Student IDs
@@ -304,57 +1822,24 @@ def main():
             break
     studentIDs = lines
     studentCount = len(lines)
+    if args.loader == "stream":
+        with metrics.stage("loadRoster"):
+            students = loadStudentsForIDs(cvsPath, studentIDs, args.workers)
 
     #################################################################
     ### Store all the data in the emails dictionary
     #################################################################
-    emailAbsencesHTML = ''
-    emails = {}  
-    studentsNotFound = {}
-    #print(f'{dates = }')
-    for i in range(len(dates)):
-        classPeriods = classDatePeriods[i]
-        for j in range(len(classPeriods)):
-            for studentID in studentIDs:
-                if studentID in students:
-                    studentName = students[studentID][0]
-                    classPeriod = classPeriods[j][0]
-                    if classPeriods[j][0] in students[studentID][1]:
-                        teacherEmailForPeriod = students[studentID][1][classPeriods[j][0]]
-                    else:
-                        continue
-                    if teacherEmailForPeriod in emails:
-                        if dates[i] in emails[teacherEmailForPeriod]:
-                            if classPeriods[j][0] in emails[teacherEmailForPeriod][dates[i]]:
-                                emails[teacherEmailForPeriod][dates[i]][classPeriods[j][0]].append(studentName)
-                            else:
-                                emails[teacherEmailForPeriod][dates[i]][classPeriods[j][0]] = [(classPeriods[j][1],classPeriods[j][2]),studentName]
-                        else:
-                            emails[teacherEmailForPeriod][dates[i]] = {classPeriods[j][0] : [(classPeriods[j][1],classPeriods[j][2]),studentName]}
-                    else:
-                        emails[teacherEmailForPeriod] = {dates[i] : {classPeriods[j][0] : [(classPeriods[j][1],classPeriods[j][2]),studentName]} }
-                else:
-                    studentsNotFound[studentID] = True
+    with metrics.stage("groupAbsences"):
+        emails, studentsNotFound = groupAbsencesByTeacher(students, studentIDs, dates, classDatePeriods)
     for key in studentsNotFound:
         print(f'{bcolors.RED}Warning!!!{bcolors.ENDC} Student ID {key} was not found in {csvStudentsFile}!!!')
 
     #################################################################
     ### transfer data into the list emailsList
     #################################################################    
-    emailsList = []
-    for email in emails:
-        emailList = [email]
-        dateList = []
-        for dateStr in emails[email]:
-            periodList = []
-            for period in emails[email][dateStr]:
-                periodList.append((period, emails[email][dateStr][period]))
-            periodList.sort()
-            dateList.append([dateStr, periodList])
-        dateList.sort()
-        emailList.append(dateList)
-        emailsList.append(emailList)
-    emailsList.sort()
+    with metrics.stage("jobHistory"):
+        jobStore = JobStore(getAppDataFilePath(jobStoreFile))
+        emailsList = getEventEmailsList(jobStore, emailSubject, emails, args.delta)
     #pprint(emailsList)
 
     #################################################################
@@ -374,139 +1859,66 @@ def main():
     #################################################################
     ### On behalf
     #################################################################
-    onBehalfOfStatement = ''
-    onBehalfOfStatementText = ''
     onBehalfOfName = input(f"{bcolors.BOLD}Enter name on whose behalf the emails are being sent (or <Enter> to skip):{bcolors.ENDC} ").strip()
-    if onBehalfOfName:
-        onBehalfOfStatement = f'<p>This email was sent by SAE on behalf of {onBehalfOfName}.</p>'
-        onBehalfOfStatementText = f'This email was sent by SAE on behalf of {onBehalfOfName}.\n'
 
     #################################################################
     ### Send the emails
     #################################################################    
-    emailHTMLTemplate = Template(
-        """
-    <html>
-    <head>
-        <title>{{ title }}</title>
-    </head>
-    <body>
-    {{onBehalfOfStatement}}
-    <p>{{emailMessage}}</p>
-    <p>The students listed below will miss <b>your</b> classes.</p>
-    {{emailAbsencesHTML}}
-    <p>{{defaultEmailFooter}}</p>
-    </body>
-    </html>
-    """
-    )
-    
-    emailTextTemplate = Template(
-        """
-{{onBehalfOfStatementText}}
-{{emailMessage}}
-    
-The students listed below will miss YOUR classes.
-    
-{{emailAbsencesText}}
-    
-{{defaultEmailFooter}}
-    """
-    )
-
     testEmailRecipient = input(f"{bcolors.BOLD}Test email address (or <Enter> to skip):{bcolors.ENDC} ").strip()
     
-    emailCount = 0
-    studentAbscenceCount = 0
-    sendTest = True
-    sendingEmails = False
-    for emailList in emailsList:
-        #pprint(emailList)
-        emailCount += 1
-        emailAddress = emailList[0]
-        periodStudentStr = ""
-        emailAbsencesHTML = ""
-        emailAbsencesText = ""
-        for dateList in emailList[1]:
-            dateStr = dateList[0]
-            dateTimeObject = datetime.strptime(
-                dateStr, "%m/%d/%y"
-            )  # Convert to datetime object
-            dateObject = dateTimeObject.date()
-            daysFromNow = (dateObject - todaysDate).days
-            dayOfTheWeek = dateTimeObject.strftime("%A")
-            periodsList = dateList[1]
-            #emailAbsencesHTML += f'<p><strong><h3 style="display:inline;">{dayOfTheWeek} {dateStr}</h3></strong>&nbsp;in {daysFromNow} day{"s" if daysFromNow != 1 else ""}</p>'
-            emailAbsencesHTML += f'<h3 style="display:inline;">{dayOfTheWeek} {dateStr}</h3>'
-            emailAbsencesText += f'\n{dayOfTheWeek} {dateStr}\n'
-            for periodTuple in periodsList:
-                period = periodTuple[0]
-                timeTuple = periodTuple[1][0]
-                studentList = periodTuple[1][1:]
-                emailAbsencesHTML += "<ul>"
-                emailAbsencesHTML += f"<h4>Period {period}"
-                emailAbsencesText += f"\nPeriod {period}"
-                if timeTuple[0]:
-                    emailAbsencesHTML += f" ({timeTuple[0]} at {timeTuple[1]})"
-                    emailAbsencesText += f" ({timeTuple[0]} at {timeTuple[1]})"
-                emailAbsencesHTML += "</h4>"
-                emailAbsencesText += "\n"
-                periodStudentStr += f"Period {period}({len(studentList)}) "
-                studentAbscenceCount += len(studentList)
-                studentList.sort()
-                # Table of students
-                emailAbsencesHTML += "<table>"
-                for student in studentList:
-                    studentName, studentID = student.split("_")
-                    emailAbsencesHTML += f'<tr><td style="padding-right: 15px;">{studentName}</td> <td>{studentID}</td></tr>'
-                    emailAbsencesText += f'\t{studentName[0:27]:27} {studentID}\n'
-                emailAbsencesHTML += "</table>"
-
-                emailAbsencesHTML += "</ul>"
-        # render the HTML email
-        emailBodyHTML = emailHTMLTemplate.render(
-            title="SAE email",
-            onBehalfOfStatement=onBehalfOfStatement,
-            emailMessage=emailMessage,
-            emailAbsencesHTML=emailAbsencesHTML,
-            defaultEmailFooter=defaultEmailFooter,
-        )
-        emailBodyText = emailTextTemplate.render(
-            onBehalfOfStatementText=onBehalfOfStatementText,
-            emailMessage=emailMessage,
-            emailAbsencesText=emailAbsencesText,
-            defaultEmailFooter=defaultEmailFooter,
-        )
+    if emailsList and testEmailRecipient:
+        emailBodyHTML, emailBodyText, periodStudentStr, absenceCount = renderTeacherEmail(emailsList[0], emailMessage, onBehalfOfName)
+        print(f"Sending a test email to {testEmailRecipient}. Check to make sure email looks OK.")
+        transport.send(testEmailRecipient, emailSubject, emailBodyHTML, emailBodyText)
 
-        if sendTest and testEmailRecipient:
-            sendTest = False
-            print(f"Sending a test email to {testEmailRecipient}. Check to make sure email looks OK.")
-            if windows:               
-                emailWithOutlookPC(testEmailRecipient, emailSubject, emailBodyHTML)
-            elif apple:
-                emailWithOutlookApple(testEmailRecipient, emailSubject, emailBodyText)
-            
-        while not sendingEmails:
-            response = input(f"{bcolors.BOLD}Send student absence email to teachers (answer 'y' or 'n')?{bcolors.ENDC} ").strip().lower()
-            if response == 'n':
-                print("  Exiting program!!!")
-                sys.exit()
-            elif response == 'y':
-                sendingEmails = True
-                break
-            else:
-                print("  Please respond with either 'y' or 'n'.")
+    while emailsList:
+        response = input(f"{bcolors.BOLD}Send student absence email to teachers (answer 'y' or 'n')?{bcolors.ENDC} ").strip().lower()
+        if response == 'n':
+            print("  Exiting program!!!")
+            sys.exit()
+        elif response == 'y':
+            break
+        else:
+            print("  Please respond with either 'y' or 'n'.")
 
-        #### SEND THE EMAILS
-        print(f"  Sending email to {emailAddress}  {periodStudentStr}")
-        if windows:
-            emailWithOutlookPC(emailAddress,emailSubject,emailBodyHTML)
-        elif apple:
-            emailWithOutlookApple(emailAddress,emailSubject,emailBodyText)
+    #### SEND THE EMAILS
+    totals = {"emails": 0, "studentPeriods": 0}
+    startTime = time.perf_counter()
+    renderEmail = lambda emailList: renderTeacherEmail(emailList, emailMessage, onBehalfOfName)
+    with metrics.stage("send"):
+        sendTimes = transport.sendAll(renderedMessages(emailsList, emailSubject, renderEmail, totals))
+    recordSendRate(sendTimes, time.perf_counter() - startTime)
+    transport.close()
+    if not transport.isDryRun:
+        with metrics.stage("jobHistory"):
+            jobStore.saveEvent(emailSubject, emailSubject, getAbsences(emails), [emailList[0] for emailList in emailsList], transport.name)
+    jobStore.close()
+    emailCount = totals["emails"]
+    studentAbscenceCount = totals["studentPeriods"]
 
     print(f"\nDONE!!! Sent {emailCount} emails ({studentCount} students missed {studentAbscenceCount} student-periods. {studentAbscenceCount/periodsMissedCount:.2f} students/period.)")
 
+def main():
+    args = parseArguments()
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        runSAE(args)
+    finally:
+        # batch mode exits with sys.exit() (and keeps stdout for the json summary)
+        with contextlib.redirect_stdout(sys.stderr) if args.job else contextlib.nullcontext():
+            metrics.write(args.metrics or getAppDataFilePath(metricsFile))
+            if args.profile:
+                profiler.disable()
+                profiler.dump_stats(getAppDataFilePath(profileFile))
+                metrics.printReport()
+                print(f"Profile saved to {getAppDataFilePath(profileFile)} (view it with: python -m pstats {getAppDataFilePath(profileFile)})")
     input("Press <Enter> to close window")
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    if getattr(sys, 'frozen', False):
+        import multiprocessing
+        multiprocessing.freeze_support()  # the roster worker processes of a pyinstaller exe (readRosterFiles())
+    main()
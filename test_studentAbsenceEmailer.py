@@ -0,0 +1,359 @@
+####################################################################################
+# Tests for the Student Absence Emailer (SAE) program that run without Windows/Outlook.
+# Run with:  python -m unittest test_studentAbsenceEmailer
+####################################################################################
+import contextlib
+import importlib.util
+import io
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+import studentAbsenceEmailer as sae
+from benchmarkSAE import LocalSmtpServer
+
+
+class FakeComError(Exception):
+    pass
+
+
+class FakeMailItem:
+    def __init__(self, outlook):
+        self.outlook = outlook
+        self.To = None
+
+    def Send(self):
+        self.outlook.events.append(("send", self.To))
+        if self.outlook.failures.get(self.To, 0) > 0:
+            self.outlook.failures[self.To] -= 1
+            raise FakeComError(f"Outlook is busy ({self.To})")
+
+
+# records every CreateItem() and Send() in events, failures[recipient] = number of times Send() fails for recipient
+class FakeOutlook:
+    def __init__(self, failures=None):
+        self.events = []
+        self.failures = dict(failures or {})
+
+    def CreateItem(self, itemType):
+        mailItem = FakeMailItem(self)
+        self.events.append(("create", itemType))
+        return mailItem
+
+
+def makeMessages(count):
+    return [(f"teacher{i}@austinisd.org", "[SAE] test", f"<p>email {i}</p>", f"email {i}") for i in range(count)]
+
+
+class OutlookPCTransportTest(unittest.TestCase):
+    def setUp(self):
+        self.outlooks = []
+
+    def dispatch(self, failures=None):
+        outlook = FakeOutlook(failures)
+        self.outlooks.append(outlook)
+        return outlook
+
+    def makeTransport(self, failures=None, **kwargs):
+        return sae.OutlookPCTransport(dispatch=lambda: self.dispatch(failures), comErrors=FakeComError, backoffSeconds=0.001, **kwargs)
+
+    def testDispatchOncePerRun(self):
+        transport = self.makeTransport()
+        transport.send("test@austinisd.org", "[SAE] test", "<p>test</p>", "test")
+        transport.sendAll(makeMessages(5))
+        self.assertEqual(len(self.outlooks), 1)
+        self.assertEqual(sum(event[0] == "send" for event in self.outlooks[0].events), 6)
+
+    def testMailItemsCreatedAndSentInBatches(self):
+        transport = self.makeTransport(batchSize=3)
+        sendTimes = transport.sendAll(makeMessages(5))
+        events = self.outlooks[0].events
+        self.assertEqual(len(sendTimes), 5)
+        self.assertEqual([event[0] for event in events], ["create"] * 3 + ["send"] * 3 + ["create"] * 2 + ["send"] * 2)
+        self.assertEqual([event[1] for event in events if event[0] == "send"], [f"teacher{i}@austinisd.org" for i in range(5)])
+
+    # the first batches are sent while the later messages are still being rendered
+    def testSendOverlapsRendering(self):
+        transport = self.makeTransport(batchSize=2)
+        sentBeforeRendered = []
+        def renderedMessages():
+            for message in makeMessages(6):
+                sentBeforeRendered.append(sum(event[0] == "send" for event in self.outlooks[0].events) if self.outlooks else 0)
+                yield message
+        transport.sendAll(renderedMessages())
+        self.assertEqual(sentBeforeRendered, [0, 0, 2, 2, 4, 4])
+
+    def testRetriesWithGrowingBackoff(self):
+        transport = self.makeTransport({"teacher1@austinisd.org": 2}, retries=3)
+        with mock.patch.object(sae.time, "sleep") as sleep, contextlib.redirect_stdout(io.StringIO()):
+            sendTimes = transport.sendAll(makeMessages(3))
+        self.assertEqual(len(sendTimes), 3)
+        self.assertEqual([event[1] for event in self.outlooks[0].events if event[0] == "send"].count("teacher1@austinisd.org"), 3)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.001, 0.002])
+
+    def testErrorReraisedAfterRetries(self):
+        transport = self.makeTransport({"teacher0@austinisd.org": 10}, retries=2)
+        with mock.patch.object(sae.time, "sleep") as sleep, contextlib.redirect_stdout(io.StringIO()):
+            with self.assertRaises(FakeComError):
+                transport.sendAll(makeMessages(2))
+        self.assertEqual([event[1] for event in self.outlooks[0].events if event[0] == "send"], ["teacher0@austinisd.org"] * 3)
+        self.assertEqual([call.args[0] for call in sleep.call_args_list], [0.001, 0.002])
+
+
+# SmtpTransport against the local SMTP stand-in server of benchmarkSAE.py
+class SmtpTransportTest(unittest.TestCase):
+    def sendAll(self, server, messageCount, **kwargs):
+        transport = sae.SmtpTransport("127.0.0.1", server.port, "sae@localhost", starttls=False, **kwargs)
+        try:
+            return transport.sendAll(makeMessages(messageCount))
+        finally:
+            transport.close()
+
+    def testEveryMessageIsDelivered(self):
+        with LocalSmtpServer(delay=0.001) as server:
+            sendTimes = self.sendAll(server, 40, concurrency=4)
+        self.assertEqual(len(sendTimes), 40)
+        self.assertEqual(server.messageCount, 40)
+        self.assertEqual(sorted(server.recipients), sorted(message[0] for message in makeMessages(40)))
+
+    def testConnectionsStayWithinConcurrency(self):
+        with LocalSmtpServer(delay=0.01) as server:
+            self.sendAll(server, 40, concurrency=3)
+        self.assertEqual(server.messageCount, 40)
+        self.assertLessEqual(server.connectionCount, 3)
+        self.assertLessEqual(server.maxOpenConnections, 3)
+
+    def testReconnectWhenServerDisconnects(self):
+        with LocalSmtpServer(delay=0.001, closeAfterMessages=2) as server:
+            self.sendAll(server, 10, concurrency=1)
+        self.assertEqual(server.messageCount, 10)
+        self.assertEqual(server.connectionCount, 5)
+
+    def testRateLimitBoundsTheWallTime(self):
+        with LocalSmtpServer(delay=0.001) as server:
+            startTime = time.perf_counter()
+            self.sendAll(server, 10, concurrency=4, ratePerSecond=20)
+            seconds = time.perf_counter() - startTime
+        self.assertEqual(server.messageCount, 10)
+        self.assertGreaterEqual(seconds, 9 / 20)  # the first message is sent right away, then one every 1/20 second
+
+
+class RosterFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tempDirectory = tempfile.TemporaryDirectory()
+        self.tempPath = self.tempDirectory.name
+
+    def tearDown(self):
+        self.tempDirectory.cleanup()
+
+    def writeFile(self, name, text):
+        path = os.path.join(self.tempPath, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+        return path
+
+    def testGlobSkipsPeriodCodesAndCalendarFiles(self):
+        rosterPath = self.writeFile("campus1.csv", "Student ID,Name,Period Type,Period,Teacher,Teacher Email\n")
+        self.writeFile(sae.periodCodesFile, "Period Code Prefix,Period\nA-01,1\n")
+        self.writeFile(sae.calendarFile, "Date,Day Type\n")
+        self.assertEqual(sae.getRosterPaths(os.path.join(self.tempPath, "*.csv")), [rosterPath])
+        self.assertEqual(sae.getRosterPaths(self.tempPath), [rosterPath])
+
+    def testShortRowsAreSkipped(self):
+        rosterPath = self.writeFile("campus1.csv", "Student ID,Name,Period Type,Period,Teacher,Teacher Email\n"
+                                                   "1234567,\"Smith, Ann\",CLASS,A-01 01,Teacher,teacher@austinisd.org\n"
+                                                   "2345678,\"Jones, Bob\"\n"
+                                                   "\n")
+        students, warnings = sae.readStudentsCsv(rosterPath)
+        self.assertEqual(list(students), ["1234567"])
+        self.assertEqual(list(students["1234567"].periods()), [("1", "teacher@austinisd.org")])
+        self.assertEqual(len(warnings), 1)
+        self.assertIn("row 3 has only 2 of the 6 columns", warnings[0])
+
+    # quoted fields with commas and newlines do not change the streamed students or the row numbers of their warnings
+    def testStreamMatchesFullLoader(self):
+        rosterPath = self.writeFile("campus1.csv", "Student ID,Name,Period Type,Period,Teacher,Teacher Email\n"
+                                                   "1234567,\"Smith,\nAnn\",CLASS,A-01 01,Teacher,teacher1@austinisd.org\n"
+                                                   "\"2345678\",\"Jones, Bob\",CLASS,A-01 01,Teacher,teacher1@austinisd.org\n"
+                                                   "2345678,\"Jones, Bob\",CLASS,A-01 01,Teacher,teacher2@austinisd.org\n")
+        students, warnings = sae.readStudentsCsv(rosterPath)
+        streamedStudents, streamedWarnings = sae.readStudentsCsv(rosterPath, {"2345678"})
+        self.assertEqual(streamedStudents, {"2345678": students["2345678"]})
+        self.assertEqual(streamedWarnings, warnings)
+        self.assertIn("row 4 Student ID 2345678 already has a previous period 1", warnings[0])
+
+
+# readStudentsCsvPandas() has to give the same students and warnings as readStudentsCsv()
+@unittest.skipUnless(importlib.util.find_spec("pandas"), "needs pandas")
+class PandasLoaderTest(unittest.TestCase):
+    def assertSameResult(self, text):
+        with tempfile.TemporaryDirectory() as tempPath:
+            rosterPath = os.path.join(tempPath, "roster.csv")
+            with open(rosterPath, "w", encoding="utf-8") as f:
+                f.write(text)
+            csvResult = sae.readStudentsCsv(rosterPath)
+            pandasResult = sae.readStudentsCsvPandas(rosterPath)
+        self.assertEqual(pandasResult, csvResult)
+        return csvResult
+
+    def testPeriodPrefixIsAnchored(self):
+        students, warnings = self.assertSameResult("Student ID,Name,Period Type,Period,Teacher,Teacher Email\n"
+                                                   "1234567,\"Smith, Ann\",CLASS,A-01 01,Teacher,teacher1@austinisd.org\n"
+                                                   "1234567,\"Smith, Ann\",CLASS,X-A-01 01,Teacher,teacher2@austinisd.org\n"
+                                                   "1234567,\"Smith, Ann\",CLASS,ZB-05,Teacher,teacher3@austinisd.org\n")
+        self.assertEqual(list(students["1234567"].periods()), [("1", "teacher1@austinisd.org"), ("???", "teacher2@austinisd.org")])
+        self.assertEqual(len(warnings), 3)
+        self.assertIn("unrecognized period X-A-01 01", warnings[1])
+        self.assertIn("unrecognized period ZB-05", warnings[2])
+
+    def testShortRowsAndBlankLines(self):
+        students, warnings = self.assertSameResult("Student ID,Name,Period Type,Period,Teacher,Teacher Email\n"
+                                                   "1234567,\"Smith,\nAnn\",CLASS,A-01 01,Teacher,teacher1@austinisd.org\n"
+                                                   "2345678,Bob\n"
+                                                   "\n"
+                                                   "3456789,\"Jones, Cy\",CLASS,A-02 02,Teacher,\n"
+                                                   "4567890,\"Lee, Di\",CLASS,A-02 02,\n"
+                                                   ",,\n"
+                                                   "5678901,\"Wu, Ed\",CLASS,A-03 03,Teacher,teacher3@austinisd.org\n")
+        self.assertEqual(list(students), ["1234567", "5678901"])
+        self.assertEqual(len(warnings), 3)
+        self.assertIn("row 3 has only 2 of the 6 columns", warnings[0])
+        self.assertIn("row 5 Student ID 3456789 for Teacher does NOT have a teacher email", warnings[1])
+        self.assertIn("row 6 has only 5 of the 6 columns", warnings[2])
+
+
+class PeriodCodesTest(unittest.TestCase):
+    def tearDown(self):
+        sae.setPeriodCodes(sae.defaultPeriodCodes)
+
+    def loadPeriodCodes(self, text):
+        with tempfile.TemporaryDirectory() as tempPath:
+            with open(os.path.join(tempPath, sae.periodCodesFile), "w", encoding="utf-8") as f:
+                f.write(text)
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                sae.loadPeriodCodes(os.path.join(tempPath, "roster.csv"))
+        return output.getvalue()
+
+    def testEmptyTableFallsBackToDefaults(self):
+        for text in ("Period Code Prefix,Period\n", "Period Code Prefix,Period\n ,1\n\n"):
+            self.assertIn("Using the default period codes", self.loadPeriodCodes(text))
+            self.assertEqual(sae.periodCodes, sae.defaultPeriodCodes)
+            self.assertEqual(sae.getPeriod("A-01 01"), "1")
+
+    def testShortRowsAreSkipped(self):
+        self.assertEqual(self.loadPeriodCodes("Period Code Prefix,Period\nX-1\nX-2,2\n"), "")
+        self.assertEqual(sae.periodCodes, [("X-2", "2")])
+        self.assertEqual(sae.getPeriod("X-2 02"), "2")
+        self.assertEqual(sae.getPeriod("A-01 01"), "???")
+
+
+class DateLineParserTest(unittest.TestCase):
+    def assertDateLineError(self, line, position, message):
+        with self.assertRaises(sae.DateLineError) as caught:
+            sae.parseDateLine(line)
+        self.assertEqual((caught.exception.position, caught.exception.message), (position, message))
+
+    def testRange(self):
+        self.assertEqual(sae.parseDateLine("04/21/25-04/24/25"), sae.DateSlot(sae.date(2025, 4, 21), sae.date(2025, 4, 24), []))
+
+    def testPeriodsWithTimes(self):
+        self.assertEqual(sae.parseDateLine("04/18/25 adv,3leaving@1:30pm").periodSlots,
+                         [sae.PeriodSlot("Adv", None, None), sae.PeriodSlot("3", "leaving", "1:30pm")])
+        self.assertEqual(sae.parseDateLine("04/18/25 5returning@10:15AM").periodSlots, [sae.PeriodSlot("5", "returning", "10:15AM")])
+
+    def testErrorPositions(self):
+        self.assertDateLineError("04/18/25  1", 9, "expected a period (1-8 or Adv)")
+        self.assertDateLineError("04/18/25 1,", 11, "expected a period (1-8 or Adv)")
+        self.assertDateLineError("04/18/25 1leaving", 17, "expected @ after leaving")
+        self.assertDateLineError("04/18/25 1leaving@1:30", 18, "expected a h:mm time ending in am or pm")
+        self.assertDateLineError("13/01/25", 0, "expected a mm/dd/yy date")
+        self.assertDateLineError("04/24/25-04/21/25", 9, "the last date is before the first date")
+
+
+class DatePeriodsTest(unittest.TestCase):
+    def expand(self, line):
+        with contextlib.redirect_stdout(io.StringIO()):
+            dates, classDatePeriods, periodsMissedCount = sae.expandDatePeriods([sae.parseDateLine(line)], sae.date(2025, 4, 1), lambda dayOfTheWeek, dateStr: "a")
+        return [(periodSlot.period, periodSlot.leaveReturn) for periodSlot in classDatePeriods[0]]
+
+    def testLeavingMissesTheRestOfTheDay(self):
+        dayPeriods = sae.periodsADay.split(",")  # 04/14/25 is a Monday (A-day)
+        self.assertEqual(self.expand("04/14/25 3leaving@10:15am"), [("3", "leaving")] + [(period, None) for period in dayPeriods[dayPeriods.index("3") + 1:]])
+        self.assertEqual(self.expand("04/14/25 3"), [("3", None)] + [(period, None) for period in dayPeriods[dayPeriods.index("3") + 1:]])
+
+    def testReturningMissesTheStartOfTheDay(self):
+        dayPeriods = sae.periodsADay.split(",")
+        self.assertEqual(self.expand("04/14/25 3returning@10:15am"), [(period, None) for period in dayPeriods[:dayPeriods.index("3")]] + [("3", "returning")])
+
+
+    # 04/21/25-04/24/25 is Monday (A-day) to Thursday (B-day)
+    def testRangePeriodsOnlyOnDaysTheyMeet(self):
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            dates, classDatePeriods, periodsMissedCount = sae.expandDatePeriods([sae.parseDateLine("04/21/25-04/24/25 1,2")], sae.date(2025, 4, 1))
+        self.assertEqual(dates, ["04/21/25", "04/23/25"])
+        self.assertEqual([[periodSlot.period for periodSlot in datePeriods] for datePeriods in classDatePeriods], [["1", "2"], ["1", "2"]])
+        self.assertEqual(periodsMissedCount, 4)
+        self.assertIn("There is no period 1,2 on Tuesday 04/22/25", output.getvalue())
+
+    def testRangeSinglePeriodOnlyOnDaysItMeets(self):
+        with contextlib.redirect_stdout(io.StringIO()):
+            dates, classDatePeriods, periodsMissedCount = sae.expandDatePeriods([sae.parseDateLine("04/21/25-04/22/25 3")], sae.date(2025, 4, 1))
+        self.assertEqual(dates, ["04/21/25"])
+        self.assertEqual([periodSlot.period for periodSlot in classDatePeriods[0]], ["3", "4"])
+
+
+    def testCalendarRowWithoutDayType(self):
+        with tempfile.TemporaryDirectory() as tempPath:
+            calendarPath = os.path.join(tempPath, sae.calendarFile)
+            with open(calendarPath, "w", encoding="utf-8") as f:
+                f.write("Date,Day Type\n04/21/25\n04/22/25,Holiday\n")
+            with contextlib.redirect_stdout(io.StringIO()) as output:
+                calendar = sae.readSchoolCalendar(calendarPath)
+        self.assertEqual(calendar, {sae.date(2025, 4, 22): "Holiday"})
+        self.assertIn("has no day type for 04/21/25", output.getvalue())
+
+
+class QueryTest(unittest.TestCase):
+    def setUp(self):
+        eventAbsences = [("e1", "[SAE] Trip", "2025-04-01T12:00:00", "teacher@austinisd.org", dateStr, "1", None, None, sae.encodeStudent(("Smith, Ann", "1234567")))
+                         for dateStr in ("04/21/25", "04/22/25", "04/23/25")]
+        self.queryIndex = sae.QueryIndex({}, eventAbsences)
+
+    def queryDates(self, kind, value, dates=None):
+        return [absence[1] for eventKey, absence in self.queryIndex.query(kind, value, sae.parseDateLine(dates) if dates else None)]
+
+    def testDatesQueryKeepsTheDatesInBothRanges(self):
+        self.assertEqual(self.queryDates("dates", "04/21/25-04/23/25"), ["04/21/25", "04/22/25", "04/23/25"])
+        self.assertEqual(self.queryDates("dates", "04/21/25-04/23/25", "04/22/25-04/30/25"), ["04/22/25", "04/23/25"])
+        self.assertEqual(self.queryDates("dates", "04/21/25", "04/22/25"), [])
+        self.assertEqual(self.queryDates("teacher", "teacher@austinisd.org", "04/23/25"), ["04/23/25"])
+
+    def testInvalidKindRejectedBeforeTheRosterIsLoaded(self):
+        with mock.patch.object(sae.sys, "argv", ["sae", "--query", "room", "101"]), contextlib.redirect_stderr(io.StringIO()) as output:
+            with self.assertRaises(SystemExit):
+                sae.parseArguments()
+        self.assertIn("invalid KIND 'room'", output.getvalue())
+
+
+class JobFilesTest(unittest.TestCase):
+    def testBadJobFilesBecomeErrorEntries(self):
+        with tempfile.TemporaryDirectory() as jobPath:
+            for name, text in (("a.json", "{bad"), ("b.json", "[1]"), ("c.json", '{"events": [3, {"subject": "ok"}]}')):
+                with open(os.path.join(jobPath, name), "w", encoding="utf-8") as f:
+                    f.write(text)
+            events, jobErrors = sae.readJobEvents(jobPath)
+        self.assertEqual([event["subject"] for event in events], ["ok"])
+        self.assertEqual([(os.path.basename(jobError["jobFile"]), jobError["status"]) for jobError in jobErrors],
+                         [("a.json", "error"), ("b.json", "error"), ("c.json", "error")])
+        self.assertTrue(jobErrors[0]["error"].startswith("JSONDecodeError"))
+
+    def testMissingJobFile(self):
+        events, jobErrors = sae.readJobEvents(os.path.join(tempfile.gettempdir(), "no such job file.json"))
+        self.assertEqual(events, [])
+        self.assertTrue(jobErrors[0]["error"].startswith("FileNotFoundError"))
+
+
+if __name__ == '__main__':
+    unittest.main()